@@ -0,0 +1,346 @@
+"""
+Сборка и раздача статических файлов.
+
+Сборка (python -m app.assets build) готовит для каждого изображения из static_files уменьшенные копии
+и версии в WebP/AVIF, а для текстовых файлов (CSS, JS, SVG) - сжатые копии .gz и .br рядом с оригиналом.
+Во время работы приложение выбирает сжатую копию по Accept-Encoding, а шаблоны строят <picture> со srcset.
+
+Собранные файлы есть только в образе приложения. Nginx раздаёт их из общего тома, который контейнер приложения
+заполняет при старте (python -m app.assets publish <каталог тома>).
+
+Ссылки на статические файлы в шаблонах (static_url) содержат хэш содержимого файла: ?v=<хэш>. Такие ответы
+кэшируются браузером на год без перепроверки, а после изменения файла меняется и ссылка на него.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import stat
+from functools import lru_cache
+
+from jinja2 import pass_context
+from markupsafe import Markup, escape
+from starlette.datastructures import URL, Headers, QueryParams
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static_files')
+
+# Каталог со сгенерированными вариантами изображений (внутри static_files, чтобы их раздавали те же маршруты)
+VARIANTS_DIR = '_variants'
+MANIFEST_NAME = 'manifest.json'
+
+IMAGE_EXTENSIONS = {'.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png'}
+TEXT_EXTENSIONS = {'.css', '.js', '.svg', '.txt'}
+
+# Ширины уменьшенных копий. В style.css картинки ограничены 313x280 px, поэтому 240-960 px
+# покрывают и обычные экраны, и экраны с двойной плотностью пикселей.
+WIDTHS = (240, 480, 960)
+
+# Форматы в порядке предпочтения браузером: type для <source> -> (расширение, параметры сохранения Pillow)
+MODERN_FORMATS = {
+    'image/avif': ('.avif', {'format': 'AVIF', 'quality': 55}),
+    'image/webp': ('.webp', {'format': 'WEBP', 'quality': 80, 'method': 6}),
+}
+
+# Сжатые копии, которые умеет отдавать приложение: кодировка -> суффикс файла (в порядке предпочтения)
+PRECOMPRESSED = {'br': '.br', 'gzip': '.gz'}
+
+# Заголовок для ссылок с хэшем: содержимое по такой ссылке никогда не меняется
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def _is_fresh(target: str, source: str) -> bool:
+    return os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source)
+
+
+def _save(image, target: str, **params):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    image.save(target, **params)
+
+
+def build_image(static_dir: str, relpath: str) -> dict:
+    """
+Функция генерации вариантов одного изображения
+    :param static_dir: Каталог статических файлов
+    :param relpath: Путь изображения относительно static_dir
+    :return: Запись манифеста: размеры оригинала и списки (ширина, путь) для каждого типа
+    """
+    from PIL import Image
+
+    source = os.path.join(static_dir, relpath)
+    stem, extension = os.path.splitext(relpath)
+    original_type = IMAGE_EXTENSIONS[extension.lower()]
+    with Image.open(source) as original:
+        original.load()
+    width, height = original.size
+    widths = [w for w in WIDTHS if w < width] + [width]
+    sources = {media_type: [] for media_type in [*MODERN_FORMATS, original_type]}
+    for w in widths:
+        resized = original if w == width else original.resize((w, round(height * w / width)), Image.LANCZOS)
+        outputs = dict(MODERN_FORMATS)
+        if w != width:
+            # Уменьшенная копия в исходном формате - для браузеров без поддержки WebP/AVIF
+            params = {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True} \
+                if original_type == 'image/jpeg' else {'format': 'PNG', 'optimize': True}
+            outputs[original_type] = (extension.lower(), params)
+        for media_type, (suffix, params) in outputs.items():
+            variant = f'{VARIANTS_DIR}/{stem}-{w}{suffix}'
+            target = os.path.join(static_dir, variant)
+            if not _is_fresh(target, source):
+                _save(resized, target, **params)
+            sources[media_type].append([w, variant])
+    # Сам оригинал - самый широкий вариант исходного формата
+    sources[original_type].append([width, relpath])
+    return {'width': width, 'height': height, 'sources': sources}
+
+
+def precompress(path: str) -> list[str]:
+    """ Функция создания копий .gz и .br текстового файла. Копия, которая не меньше оригинала, не сохраняется. """
+    with open(path, 'rb') as file:
+        data = file.read()
+    encoders = {'.gz': lambda raw: gzip.compress(raw, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+        encoders['.br'] = lambda raw: brotli.compress(raw, quality=11)
+    except ImportError:
+        pass
+    written = []
+    for suffix, encode in encoders.items():
+        target = path + suffix
+        if _is_fresh(target, path):
+            written.append(target)
+            continue
+        compressed = encode(data)
+        if len(compressed) < len(data):
+            with open(target, 'wb') as file:
+                file.write(compressed)
+            written.append(target)
+    return written
+
+
+def build(static_dir: str = STATIC_DIR) -> dict:
+    """
+Функция сборки статических файлов
+    :param static_dir: Каталог статических файлов
+    :return: Манифест изображений (он же сохраняется в VARIANTS_DIR/MANIFEST_NAME)
+    """
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if d != VARIANTS_DIR)
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            relpath = os.path.relpath(path, static_dir).replace(os.sep, '/')
+            extension = os.path.splitext(name)[1].lower()
+            if extension in IMAGE_EXTENSIONS:
+                manifest[relpath] = build_image(static_dir, relpath)
+            elif extension in TEXT_EXTENSIONS:
+                precompress(path)
+    manifest_path = os.path.join(static_dir, VARIANTS_DIR, MANIFEST_NAME)
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    with open(manifest_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=1, ensure_ascii=False)
+    return manifest
+
+
+def publish(target_dir: str, static_dir: str = STATIC_DIR) -> int:
+    """
+Функция копирования собранных статических файлов в каталог, который раздаёт nginx
+    :param target_dir: Каталог назначения (общий том контейнеров приложения и nginx)
+    :param static_dir: Каталог статических файлов
+    :return: Число скопированных файлов. Файлы, которых больше нет в static_dir, удаляются из target_dir
+    """
+    copied = 0
+    published = set()
+    for root, dirs, files in os.walk(static_dir):
+        for name in files:
+            relpath = os.path.relpath(os.path.join(root, name), static_dir)
+            published.add(relpath)
+            source = os.path.join(static_dir, relpath)
+            target = os.path.join(target_dir, relpath)
+            # copy2 сохраняет время изменения: по нему пропускаются неизменившиеся файлы
+            if os.path.exists(target) and os.path.getmtime(target) == os.path.getmtime(source) \
+                    and os.path.getsize(target) == os.path.getsize(source):
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(source, target)
+            copied += 1
+    for root, dirs, files in os.walk(target_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            if os.path.relpath(path, target_dir) not in published:
+                os.remove(path)
+    return copied
+
+
+@lru_cache
+def load_manifest(static_dir: str = STATIC_DIR) -> dict:
+    """ Манифест вариантов изображений. Если сборка не запускалась, он пуст и шаблоны выводят обычный <img>. """
+    try:
+        with open(os.path.join(static_dir, VARIANTS_DIR, MANIFEST_NAME), encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+@lru_cache
+def _static_versions(static_dir: str) -> dict[str, str]:
+    versions = {}
+    for root, dirs, files in os.walk(static_dir):
+        for name in files:
+            # Сжатые копии раздаются по ссылке оригинала и его хэшу
+            if os.path.splitext(name)[1] in PRECOMPRESSED.values():
+                continue
+            path = os.path.join(root, name)
+            versions[os.path.relpath(path, static_dir).replace(os.sep, '/')] = file_hash(path)
+    return versions
+
+
+def static_versions(static_dir: str = STATIC_DIR) -> dict[str, str]:
+    """
+Манифест версий статических файлов: путь относительно static_dir -> хэш содержимого.
+Строится один раз (при старте приложения) и хранится в памяти процесса.
+    :param static_dir: Каталог статических файлов
+    """
+    return _static_versions(os.path.abspath(static_dir))
+
+
+def _static_url(request, path: str) -> URL:
+    relpath = path.lstrip('/')
+    url = request.url_for('static', path='/' + relpath)
+    version = static_versions().get(relpath)
+    return url.include_query_params(v=version) if version else url
+
+
+@pass_context
+def static_url(context, path: str) -> str:
+    """
+Jinja-функция ссылки на статический файл с хэшем содержимого, например /static_files/style.css?v=1a2b3c4d5e6f
+    :param path: Путь файла внутри static_files, например '/style.css'
+    """
+    return str(_static_url(context['request'], path))
+
+
+@pass_context
+def picture(context, path: str, title: str = '', sizes: str = '210px') -> Markup:
+    """
+Jinja-функция вывода изображения. Для собранных изображений строит <picture> с AVIF/WebP и srcset,
+для остальных - обычный <img>.
+    :param path: Путь изображения внутри static_files, например '/barsik_page/bars_lijet.jpg'
+    :param title: Подпись изображения
+    :param sizes: Ширина изображения на странице (атрибут sizes)
+    """
+    request = context['request']
+
+    def url(relpath: str) -> str:
+        return str(_static_url(request, relpath))
+
+    relpath = path.lstrip('/')
+    title = escape(title)
+    entry = load_manifest().get(relpath)
+    if entry is None:
+        return Markup(f"<img title='{title}' src=\"{url(relpath)}\"/>")
+    # Только файлы, которые действительно есть в static_files: браузер, выбравший <source> с отсутствующим
+    # файлом, не переходит к <img>, и изображение не показывается
+    versions = static_versions()
+    tags = []
+    for media_type, candidates in entry['sources'].items():
+        candidates = [(width, variant) for width, variant in candidates if variant in versions]
+        if media_type in MODERN_FORMATS and not candidates:
+            continue
+        srcset = ', '.join(f'{url(variant)} {width}w' for width, variant in candidates)
+        if media_type in MODERN_FORMATS:
+            tags.append(f'<source type="{media_type}" srcset="{srcset}" sizes="{sizes}"/>')
+        else:
+            tags.append(
+                # width/height не указываются: вместе с max-width/max-height из CSS они исказили бы пропорции
+                f"<img title='{title}' src=\"{url(relpath)}\" srcset=\"{srcset}\" sizes=\"{sizes}\" "
+                f"loading=\"lazy\" decoding=\"async\"/>"
+            )
+    return Markup('<picture>' + ''.join(tags) + '</picture>')
+
+
+def register(templates) -> None:
+    """ Регистрация Jinja-функций static_url и picture в окружении шаблонов """
+    templates.env.globals['static_url'] = static_url
+    templates.env.globals['picture'] = picture
+
+
+def accepted_encodings(header: str) -> set[str]:
+    """ Кодировки из заголовка Accept-Encoding, которые клиент принимает (q > 0) """
+    encodings = set()
+    for item in header.split(','):
+        name, _, params = item.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            encodings.add(name.strip().lower())
+    return encodings
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+StaticFiles, отдающий заранее сжатую копию файла (.br или .gz), если клиент её принимает.
+Ответы на ссылки с актуальным хэшем содержимого (?v=...) кэшируются браузером без перепроверки.
+    """
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        response = await super().get_response(path, scope)
+        if not isinstance(response, FileResponse) or response.status_code != 200:
+            return response
+        response = self._precompressed(path, scope, response)
+        version = QueryParams(scope['query_string']).get('v')
+        relpath = os.path.normpath(path).replace(os.sep, '/')
+        # Ссылка со старым хэшем (после деплоя) получает текущий файл, но без долгого кэширования
+        if version is not None and version == static_versions(str(self.directory)).get(relpath):
+            response.headers['cache-control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+    def _precompressed(self, path: str, scope: Scope, response: FileResponse) -> FileResponse:
+        accepted = accepted_encodings(Headers(scope=scope).get('accept-encoding', ''))
+        has_variants = False
+        for encoding, suffix in PRECOMPRESSED.items():
+            full_path, stat_result = self.lookup_path(path + suffix)
+            if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+                continue
+            has_variants = True
+            if encoding in accepted:
+                compressed = self.file_response(full_path, stat_result, scope)
+                compressed.headers['content-type'] = response.headers['content-type']
+                compressed.headers['content-encoding'] = encoding
+                compressed.headers['vary'] = 'Accept-Encoding'
+                return compressed
+        if has_variants:
+            response.headers['vary'] = 'Accept-Encoding'
+        return response
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['build', 'publish'])
+    parser.add_argument('target', nargs='?', help='Каталог назначения для publish')
+    parser.add_argument('--static-dir', default=STATIC_DIR)
+    args = parser.parse_args()
+    if args.command == 'publish':
+        if args.target is None:
+            parser.error('для publish нужен каталог назначения')
+        print(f'Скопировано файлов: {publish(args.target, args.static_dir)}')
+    else:
+        images = build(args.static_dir)
+        print(f'Собрано изображений: {len(images)}')
@@ -0,0 +1,214 @@
+"""
+Массовый импорт пользователей из CSV или NDJSON.
+
+Пароли хэшируются параллельно на всех ядрах, пользователи вставляются пачками в отдельных транзакциях.
+Ошибочные строки (невалидные данные, занятый логин или почта) попадают в отчёт и не прерывают импорт.
+
+Запуск: python -m app.bulk_import users.csv [--batch-size 1000] [--workers 8] [--errors errors.ndjson]
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
+
+from pydantic import ValidationError
+from sqlalchemy import Engine, insert, or_
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from .routers.db import User, UserCreate
+from .routers.hashing import hash_password
+
+
+@dataclass
+class RowError:
+    line: int
+    username: str | None
+    error: str
+
+
+@dataclass
+class MalformedRecord:
+    """ Строка NDJSON, которая не разбирается как JSON: вместо прерывания чтения она попадает в отчёт """
+    error: str
+
+
+# Запись файла: номер строки и поля пользователя
+Record = tuple[int, dict | MalformedRecord]
+
+
+@dataclass
+class ImportReport:
+    read: int = 0
+    imported: int = 0
+    errors: list[RowError] = field(default_factory=list)
+    hash_seconds: float = 0.0
+    insert_seconds: float = 0.0
+    total_seconds: float = 0.0
+
+    def summary(self) -> str:
+        rate = self.imported / self.total_seconds if self.total_seconds else 0.0
+        hash_rate = self.imported / self.hash_seconds if self.hash_seconds else 0.0
+        return (
+            f'прочитано: {self.read}, импортировано: {self.imported}, с ошибками: {len(self.errors)}\n'
+            f'время: {self.total_seconds:.1f} с ({rate:.0f} польз./с), '
+            f'хэширование: {self.hash_seconds:.1f} с ({hash_rate:.0f} хэшей/с), '
+            f'вставка: {self.insert_seconds:.2f} с'
+        )
+
+
+def read_records(path: str) -> Iterator[Record]:
+    """
+Функция чтения записей из файла
+    :param path: Путь к файлу .csv (с заголовком) или .ndjson/.jsonl
+    :return: Пары (номер строки, словарь полей). Для неразборчивой строки NDJSON вместо словаря - MalformedRecord
+    """
+    with open(path, encoding='utf-8', newline='') as file:
+        if path.endswith('.csv'):
+            # Первая строка - заголовок, поэтому данные начинаются со второй
+            for line, row in enumerate(csv.DictReader(file), start=2):
+                # Пустая ячейка CSV означает отсутствие значения
+                yield line, {key: value for key, value in row.items() if value != ''}
+        else:
+            for line, text in enumerate(file, start=1):
+                if not text.strip():
+                    continue
+                try:
+                    yield line, json.loads(text)
+                except json.JSONDecodeError as exc:
+                    yield line, MalformedRecord(f'invalid JSON: {exc}')
+
+
+def _batches(records: Iterable[Record], size: int) -> Iterator[list[Record]]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _validate(batch: list[Record], session: Session, report: ImportReport) -> list[tuple[int, UserCreate]]:
+    """ Проверка строк пачки: валидация модели и уникальность логина/почты в файле и в БД """
+    valid = []
+    for line, data in batch:
+        if isinstance(data, MalformedRecord):
+            report.errors.append(RowError(line, None, data.error))
+            continue
+        try:
+            valid.append((line, UserCreate.model_validate(data)))
+        except ValidationError as exc:
+            # Строка NDJSON может быть любым значением JSON, а не только объектом
+            username = data.get('username') if isinstance(data, dict) else None
+            report.errors.append(RowError(line, username, exc.errors()[0]['msg']))
+    usernames = {user.username for _, user in valid}
+    usermails = {user.usermail for _, user in valid if user.usermail}
+    taken = session.exec(select(User.username, User.usermail).where(
+        or_(User.username.in_(usernames), User.usermail.in_(usermails))
+    )).all()
+    taken_usernames = {username for username, _ in taken}
+    taken_usermails = {usermail for _, usermail in taken if usermail}
+    unique = []
+    for line, user in valid:
+        if user.username in taken_usernames:
+            report.errors.append(RowError(line, user.username, 'username already exists'))
+        elif user.usermail and user.usermail in taken_usermails:
+            report.errors.append(RowError(line, user.username, 'usermail already exists'))
+        else:
+            # Следующие строки файла с тем же логином или почтой тоже будут дубликатами
+            taken_usernames.add(user.username)
+            if user.usermail:
+                taken_usermails.add(user.usermail)
+            unique.append((line, user))
+    return unique
+
+
+def _row(user: UserCreate, hashed_password: str) -> dict:
+    return User.model_validate(user, update={"hashed_password": hashed_password}).model_dump(exclude={"id"})
+
+
+def _insert(session: Session, rows: list[tuple[int, UserCreate, dict]], report: ImportReport):
+    """ Вставка пачки одной транзакцией. Если её сорвал конфликт, пачка вставляется построчно. """
+    try:
+        session.execute(insert(User), [row for _, _, row in rows])
+        session.commit()
+        report.imported += len(rows)
+        return
+    except IntegrityError:
+        session.rollback()
+    for line, user, row in rows:
+        try:
+            session.execute(insert(User), [row])
+            session.commit()
+            report.imported += 1
+        except IntegrityError as exc:
+            session.rollback()
+            report.errors.append(RowError(line, user.username, str(exc.orig)))
+
+
+def import_users(
+        records: Iterable[Record],
+        engine: Engine,
+        batch_size: int = 1000,
+        workers: int | None = None,
+) -> ImportReport:
+    """
+Функция импорта пользователей
+    :param records: Пары (номер строки, словарь полей UserCreate)
+    :param engine: Движок БД
+    :param batch_size: Число строк в одной транзакции
+    :param workers: Число процессов для хэширования (по умолчанию - по числу ядер)
+    :return: Отчёт об импорте
+    """
+    report = ImportReport()
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor, \
+            Session(engine) as session:
+        for batch in _batches(records, batch_size):
+            report.read += len(batch)
+            users = _validate(batch, session, report)
+            hash_started = time.perf_counter()
+            chunksize = max(1, len(users) // (workers * 4))
+            hashes = executor.map(hash_password, [user.password for _, user in users], chunksize=chunksize)
+            rows = [(line, user, _row(user, hashed)) for (line, user), hashed in zip(users, hashes)]
+            report.hash_seconds += time.perf_counter() - hash_started
+            insert_started = time.perf_counter()
+            _insert(session, rows, report)
+            report.insert_seconds += time.perf_counter() - insert_started
+    report.total_seconds = time.perf_counter() - started
+    report.errors.sort(key=lambda error: error.line)
+    return report
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='Файл .csv или .ndjson с полями UserCreate')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Число строк в одной транзакции')
+    parser.add_argument('--workers', type=int, default=None, help='Число процессов для хэширования паролей')
+    parser.add_argument('--errors', help='Файл для отчёта об ошибочных строках в формате NDJSON')
+    args = parser.parse_args(argv)
+
+    from .routers.sql_db import create_db_and_tables, get_engine
+    create_db_and_tables()
+    report = import_users(read_records(args.path), get_engine(), batch_size=args.batch_size, workers=args.workers)
+    for error in report.errors:
+        print(f'строка {error.line} ({error.username}): {error.error}', file=sys.stderr)
+    if args.errors:
+        with open(args.errors, 'w', encoding='utf-8') as file:
+            for error in report.errors:
+                file.write(json.dumps(error.__dict__, ensure_ascii=False) + '\n')
+    print(report.summary())
+    return 1 if report.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
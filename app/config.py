@@ -12,6 +12,46 @@ class Settings(BaseSettings):
     redis_password: str                 # Пароль для подключения к Redis
     base_dir: str = os.path.abspath(os.path.join(os.path.dirname(__file__), '..')) # Абсолютная корневая директория проекта
     docker_redis_host: str              # Имя контейнера с Redis
+    page_cache_ttl: float = 60          # Время жизни контента страниц в кэше процесса, сек
+    redis_max_connections: int = 32     # Максимальный размер пула соединений с Redis
+    redis_pool_timeout: float = 2       # Время ожидания свободного соединения из пула, сек
+    redis_socket_timeout: float = 1     # Таймаут чтения/записи в сокет Redis, сек
+    redis_connect_timeout: float = 1    # Таймаут установки соединения с Redis, сек
+    redis_health_check_interval: int = 30   # Период проверки простаивающих соединений (PING), сек
+    token_cache_size: int = 10000       # Максимальное число проверенных JWT-токенов в кэше процесса
+    token_cache_ttl: float = 300        # Время жизни проверенного токена в кэше, сек
+    password_hash_workers: int = 0      # Число процессов для bcrypt (0 - по числу ядер)
+    password_hash_max_pending: int = 64 # Максимум ожидающих операций bcrypt, сверх него - ответ 503
+    database_url: str = 'sqlite:///database.db'  # URL базы данных SQLAlchemy
+    db_pool_size: int = 5               # Число постоянных соединений в пуле БД
+    db_max_overflow: int = 10           # Число дополнительных соединений сверх pool_size при пиковой нагрузке
+    db_pool_timeout: float = 30         # Время ожидания свободного соединения из пула БД, сек
+    sqlite_busy_timeout_ms: int = 5000  # Сколько SQLite ждёт снятия блокировки записи, мс
+    sqlite_mmap_size: int = 268435456   # Размер отображаемой в память части файла SQLite, байт
+    template_cache_dir: str = ''        # Каталог байткода шаблонов Jinja2 (пусто - временный каталог системы)
+    profile_sample_rate: float = 0      # Доля профилируемых запросов (0 - выборочное профилирование выключено)
+    profile_header_token: str = ''      # Значение заголовка X-Profile для профилирования запроса (пусто - выключено)
+    profile_dir: str = 'profiles'       # Каталог профилей запросов
+    profile_interval: float = 0.001     # Период снятия стека профайлером, сек
+    profile_max_files: int = 20         # Сколько последних профилей хранить для каждого маршрута
+    server_workers: int = 0             # Число процессов python -m app.server (0 - по числу ядер)
+    create_schema_on_startup: bool = True   # Создавать таблицы и индексы при старте процесса (app.server делает это сам)
+    warmup_connections: int = 4         # Сколько соединений с Redis и БД открывается при старте процесса
+    token_revocation_capacity: int = 100000     # Ожидаемое число отозванных, ещё не истёкших токенов
+    token_revocation_error_rate: float = 0.001  # Доля ложных срабатываний фильтра Блума (тогда проверка идёт в Redis)
+    token_revocation_rebuild_interval: float = 600  # Период пересборки фильтра отозванных токенов из Redis, сек
+    rate_limit_window: float = 60       # Окно ограничения частоты логинов и регистраций, сек
+    rate_limit_per_ip: int = 30         # Попыток за окно с одного IP-адреса (0 - без ограничения)
+    rate_limit_per_username: int = 10   # Попыток за окно для одного логина (0 - без ограничения)
+    redis_budget_page_content: float = 0.25     # Бюджет чтения контента страницы из Redis, сек
+    redis_budget_rate_limit: float = 0.1        # Бюджет проверки ограничителя частоты, сек
+    redis_budget_token_revocation: float = 0.05 # Бюджет проверки отзыва токена в Redis, сек
+    redis_breaker_failures: int = 5     # Сколько отказов Redis подряд размыкают выключатель
+    redis_breaker_reset: float = 5      # Период проб Redis при разомкнутом выключателе, сек
+    compression_min_size: int = 1024    # Ответы меньше этого размера, байт, не сжимаются
+    compression_gzip_level: int = 6     # Степень gzip для ответов, сжимаемых на каждом запросе (1-9)
+    compression_brotli_quality: int = 4 # Качество brotli для ответов, сжимаемых на каждом запросе (0-11)
+    forwarded_allow_ips: str = '127.0.0.1'  # Адреса или подсети прокси, которым доверяется X-Forwarded-For
 
     # Указание файла с переменными окружения
     model_config = SettingsConfigDict(env_file=f"{os.path.dirname(os.path.abspath(__file__))}/../.env")
@@ -0,0 +1,176 @@
+"""
+Публикация контента страниц в Redis из одного файла YAML или JSON.
+
+Файл - словарь <ключ Redis>: <значение>. Строка записывается командой SET, список - RPUSH (порядок сохраняется),
+словарь - HSET. Нужны все ключи, которые читают документы page_content.DOCUMENTS, например:
+
+    index_page: {title: ..., header: ..., header2: ..., p1: ..., p2: ...}
+    index_page_nav: [О Барсике, О Марсике, Войти]
+    log_out_message: Вы вышли из системы
+
+Все ключи записываются одним конвейером MULTI/EXEC под префиксом новой версии, затем одной командой SET
+переключается указатель версии. Читатели видят либо старый контент целиком, либо новый целиком.
+Версия - хеш содержимого, поэтому повторная публикация того же файла ничего не меняет.
+Предыдущие версии (--keep) остаются в Redis для отката: python -m app.content_loader --activate <версия>.
+
+Запуск: python -m app.content_loader content.yaml [--keep 2]
+        python -m app.content_loader --list
+        python -m app.content_loader --activate <версия>
+"""
+import argparse
+import hashlib
+import json
+import sys
+
+import redis
+import yaml
+
+from .config import settings
+from .routers.page_cache import INVALIDATION_CHANNEL
+from .routers.page_content import CONTENT_KEY_PREFIX, CONTENT_VERSION_KEY, DOCUMENTS, versioned_key
+
+# Список опубликованных версий, последняя активированная - первая
+CONTENT_VERSIONS_KEY = 'page_content:versions'
+
+
+def read_content(path: str) -> dict:
+    """
+Функция чтения файла контента
+    :param path: Путь к файлу .yaml/.yml или .json
+    :return: Словарь <ключ Redis>: <значение>
+    """
+    with open(path, encoding='utf-8') as file:
+        if path.endswith(('.yaml', '.yml')):
+            return yaml.safe_load(file) or {}
+        return json.load(file)
+
+
+def validate(content: dict) -> list[str]:
+    """ Функция проверки контента: каждый ключ, который читают документы, есть и имеет нужный тип """
+    errors = []
+    for document, fields in DOCUMENTS.items():
+        for field in {field for verified in (False, True) for field in fields(verified)}:
+            value = content.get(field.key)
+            if value is None:
+                errors.append(f'{document}: нет ключа {field.key}')
+            elif field.command == 'lrange' and not isinstance(value, list):
+                errors.append(f'{document}: {field.key} должен быть списком')
+            elif field.command == 'hget' and (not isinstance(value, dict) or field.hash_field not in value):
+                errors.append(f'{document}: {field.key} должен быть словарём с полем {field.hash_field}')
+            elif field.command == 'get' and isinstance(value, (list, dict)):
+                errors.append(f'{document}: {field.key} должен быть строкой')
+    return sorted(set(errors))
+
+
+def content_version(content: dict) -> str:
+    dump = json.dumps(content, sort_keys=True, ensure_ascii=False).encode()
+    return hashlib.sha1(dump).hexdigest()[:12]
+
+
+def activate(client: redis.Redis, version: str):
+    """
+Функция переключения указателя на опубликованную версию
+    :param client: Синхронный клиент Redis
+    :param version: Версия из списка опубликованных
+    """
+    if version not in client.lrange(CONTENT_VERSIONS_KEY, 0, -1):
+        raise ValueError(f'версия {version} не опубликована')
+    with client.pipeline(transaction=True) as pipe:
+        pipe.set(CONTENT_VERSION_KEY, version)
+        pipe.lrem(CONTENT_VERSIONS_KEY, 0, version)
+        pipe.lpush(CONTENT_VERSIONS_KEY, version)
+        # Процессы без keyspace-уведомлений узнают о новой версии из канала инвалидации
+        pipe.publish(INVALIDATION_CHANNEL, '*')
+        pipe.execute()
+
+
+def prune(client: redis.Redis, keep: int) -> list[str]:
+    """
+Функция удаления старых версий
+    :param client: Синхронный клиент Redis
+    :param keep: Сколько версий хранить кроме текущей
+    :return: Удалённые версии
+    """
+    current = client.get(CONTENT_VERSION_KEY)
+    removed = [version for version in client.lrange(CONTENT_VERSIONS_KEY, 0, -1) if version != current][keep:]
+    for version in removed:
+        keys = list(client.scan_iter(match=f'{CONTENT_KEY_PREFIX}{version}:*', count=1000))
+        with client.pipeline(transaction=True) as pipe:
+            if keys:
+                pipe.unlink(*keys)
+            pipe.lrem(CONTENT_VERSIONS_KEY, 0, version)
+            pipe.execute()
+    return removed
+
+
+def publish(client: redis.Redis, content: dict, keep: int = 2) -> str:
+    """
+Функция публикации контента новой версией
+    :param client: Синхронный клиент Redis
+    :param content: Словарь <ключ Redis>: <значение>, прошедший validate
+    :param keep: Сколько предыдущих версий оставить для отката
+    :return: Опубликованная версия
+    """
+    version = content_version(content)
+    with client.pipeline(transaction=True) as pipe:
+        for key, value in content.items():
+            name = versioned_key(version, key)
+            pipe.delete(name)
+            if isinstance(value, list):
+                # Пустой список в Redis - это отсутствие ключа, LRANGE вернёт [] и так
+                if value:
+                    pipe.rpush(name, *map(str, value))
+            elif isinstance(value, dict):
+                if value:
+                    pipe.hset(name, mapping={field: str(item) for field, item in value.items()})
+            else:
+                pipe.set(name, str(value))
+        pipe.lrem(CONTENT_VERSIONS_KEY, 0, version)
+        pipe.lpush(CONTENT_VERSIONS_KEY, version)
+        pipe.execute()
+    activate(client, version)
+    prune(client, keep)
+    return version
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', nargs='?', help='Файл контента .yaml/.yml или .json')
+    parser.add_argument('--keep', type=int, default=2, help='Сколько предыдущих версий хранить для отката')
+    parser.add_argument('--activate', metavar='VERSION', help='Переключиться на опубликованную версию')
+    parser.add_argument('--list', action='store_true', help='Показать опубликованные версии')
+    args = parser.parse_args(argv)
+
+    client = redis.Redis(host=settings.redis_host, port=settings.redis_port,
+                         password=settings.redis_password or None, decode_responses=True)
+    try:
+        if args.list:
+            current = client.get(CONTENT_VERSION_KEY)
+            for version in client.lrange(CONTENT_VERSIONS_KEY, 0, -1):
+                print(f'{version}{" (текущая)" if version == current else ""}')
+            return 0
+        if args.activate:
+            try:
+                activate(client, args.activate)
+            except ValueError as exc:
+                print(exc, file=sys.stderr)
+                return 1
+            print(f'текущая версия: {args.activate}')
+            return 0
+        if not args.path:
+            parser.error('нужен файл контента, --activate или --list')
+        content = read_content(args.path)
+        errors = validate(content)
+        for error in errors:
+            print(error, file=sys.stderr)
+        if errors:
+            return 1
+        version = publish(client, content, keep=args.keep)
+        print(f'опубликована версия {version}: {len(content)} ключей')
+        return 0
+    finally:
+        client.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
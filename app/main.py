@@ -1,5 +1,9 @@
-import uvicorn
-from fastapi import FastAPI, HTTPException, status, Request
+# Первым импортом: от него отсчитывается время импорта приложения в отчёте о старте
+import time
+from .startup import startup_report
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, FastAPI, HTTPException, status, Request
+from fastapi.exception_handlers import http_exception_handler as default_http_exception_handler
 from app.routers.pages import router as pages_router, templates
 from app.routers.safety import (router as safety_router,
                             verify_token,
@@ -7,7 +11,8 @@ from app.routers.safety import (router as safety_router,
                             OAuth2PasswordRequestForm,
                             authenticate_user,
                             get_user,
-                            get_session as get_safety_session)
+                            get_session as get_safety_session,
+                            get_async_session)
 from app.routers.db import (router as db_router,
                         get_session as get_db_session,
                         UserCreate,
@@ -17,21 +22,76 @@ from app.routers.db import (router as db_router,
                         UserPublic,
                         UserBase)
 
-from fastapi.staticfiles import StaticFiles
-from os.path import realpath, relpath
-from .routers.no_sql_db import redis_client
+from .routers.page_content import page_content, ContentUnavailable
+from .routers.no_sql_db import lifespan as redis_lifespan
+from .assets import PrecompressedStaticFiles, STATIC_DIR
+from .routers.metrics import MetricsMiddleware, router as metrics_router
+from .routers.profiling import ProfilingMiddleware
+from .routers.compression import CompressionMiddleware
+from .config import settings
+from .warmup import warm_up
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Внешний контекст: пул Redis закрывается последним, после остановки слушателей роутеров
+    async with redis_lifespan(app):
+        yield
+
+
+@asynccontextmanager
+async def startup(router: APIRouter):
+    # Внутренний контекст выполняется после lifespan всех роутеров (шаблоны, схема БД).
+    # Процесс начинает принимать запросы только после прогрева пулов соединений и кэша контента
+    with startup_report.measure('warmup: warm_up'):
+        await warm_up()
+    startup_report.log()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(pages_router)
 app.include_router(safety_router)
 app.include_router(db_router)
+app.include_router(metrics_router)
+app.include_router(APIRouter(lifespan=startup))
+
+# Сжатие - внутренний слой: профиль и метрики запроса включают время сжатия ответа
+app.add_middleware(
+    CompressionMiddleware,
+    min_size=settings.compression_min_size,
+    gzip_level=settings.compression_gzip_level,
+    brotli_quality=settings.compression_brotli_quality,
+)
+
+# Профилирование включается только настройками: без них middleware не добавляется вовсе
+if settings.profile_sample_rate > 0 or settings.profile_header_token:
+    app.add_middleware(
+        ProfilingMiddleware,
+        directory=settings.profile_dir,
+        sample_rate=settings.profile_sample_rate,
+        header_token=settings.profile_header_token,
+        interval=settings.profile_interval,
+        max_files=settings.profile_max_files,
+    )
+app.add_middleware(MetricsMiddleware)
+
+# Единственное подключение статических файлов: роутеры ссылаются на него через url_for('static')
+app.mount('/static_files', PrecompressedStaticFiles(directory=STATIC_DIR), name='static')
+
 
-app.mount('/static_files', StaticFiles(directory=relpath(f'{relpath(__file__)}/../static_files')), name='static')
+startup_report.record('import app.main', time.perf_counter() - startup_report.created)
 
 
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
+    if exc.status_code in (401, 404):
+        try:
+            content = await page_content.get('failed_authorization')
+        except ContentUnavailable:
+            # Без контента страница ошибки не рендерится: код ответа важнее текста
+            return await default_http_exception_handler(request, exc)
     if exc.status_code == 401:
         return templates.TemplateResponse(
             request=request,
@@ -39,7 +99,7 @@ async def http_exception_handler(request, exc):
             status_code=exc.status_code,
             headers=exc.headers,
             context={
-                "message_401": redis_client.hget('failed_authorization_page', 'message_401')
+                "message_401": content['message_401']
             }
         )
     if exc.status_code == 404:
@@ -49,6 +109,8 @@ async def http_exception_handler(request, exc):
             status_code=exc.status_code,
             headers=exc.headers,
             context={
-                "message_404": redis_client.hget('failed_authorization_page', 'message_404')
+                "message_404": content['message_404']
             }
         )
+    # Остальные ошибки (503 при переполнении очереди bcrypt, 429 ограничителя частоты) - стандартным обработчиком
+    return await default_http_exception_handler(request, exc)
@@ -0,0 +1,107 @@
+"""
+Автоматический выключатель (circuit breaker) для обращений к Redis.
+
+Каждое обращение ограничено своим бюджетом времени. После failure_threshold ошибок или превышений бюджета
+подряд выключатель размыкается: вызовы сразу получают CircuitOpenError, не занимая соединения и не ожидая
+таймаутов, а вызывающий код отдаёт запасной ответ (устаревшую копию контента, пропуск проверки). Раз в
+reset_timeout секунд в фоне выполняется проба (PING); после успешной пробы выключатель замыкается.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, TypeVar
+
+from .metrics import circuit_breaker_open, circuit_breaker_rejected
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class CircuitOpenError(Exception):
+    """ Выключатель разомкнут: обращение не выполнялось """
+
+
+class CircuitBreaker:
+    """ Выключатель с фоновой пробой восстановления """
+
+    def __init__(
+            self,
+            name: str,
+            probe: Callable[[], Awaitable],
+            failure_threshold: int,
+            reset_timeout: float,
+            errors: tuple[type[BaseException], ...] = (Exception,),
+    ):
+        """
+Настройка выключателя
+    :param name: Имя выключателя - метка метрик и логов
+    :param probe: Корутинная функция пробы восстановления, например PING
+    :param failure_threshold: Сколько ошибок подряд размыкают выключатель
+    :param reset_timeout: Период проб разомкнутого выключателя, сек
+    :param errors: Исключения, считающиеся отказом. Превышение бюджета (TimeoutError) - отказ всегда
+        """
+        self.name = name
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.errors = (*errors, TimeoutError)
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probe: asyncio.Task | None = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    async def call(self, operation: Callable[[], Awaitable[T]], budget: float | None = None) -> T:
+        """
+Выполнение обращения через выключатель
+    :param operation: Корутинная функция обращения
+    :param budget: Бюджет времени обращения, сек (None - без ограничения)
+    :return: Результат обращения
+        """
+        if self.is_open:
+            self._schedule_probe()
+            circuit_breaker_rejected.inc(self.name)
+            raise CircuitOpenError(self.name)
+        try:
+            async with asyncio.timeout(budget):
+                result = await operation()
+        except self.errors:
+            self._record_failure()
+            raise
+        self._failures = 0
+        return result
+
+    def _record_failure(self):
+        self._failures += 1
+        if self._failures >= self.failure_threshold and not self.is_open:
+            logger.warning('Выключатель %s разомкнут после %d отказов подряд', self.name, self._failures)
+            self._opened_at = time.monotonic()
+            circuit_breaker_open.inc(self.name)
+
+    def _schedule_probe(self):
+        if self._probe is not None and not self._probe.done() \
+                and self._probe.get_loop() is asyncio.get_running_loop():
+            return
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._probe = asyncio.ensure_future(self._run_probe())
+
+    async def _run_probe(self):
+        try:
+            await self.probe()
+        except self.errors as exc:
+            # Следующая проба - не раньше чем через reset_timeout
+            self._opened_at = time.monotonic()
+            logger.warning('Проба выключателя %s не удалась: %s', self.name, exc)
+        else:
+            self.reset()
+
+    def reset(self):
+        """ Замыкание выключателя """
+        if self.is_open:
+            logger.info('Выключатель %s замкнут', self.name)
+            circuit_breaker_open.dec(self.name)
+        self._failures = 0
+        self._opened_at = None
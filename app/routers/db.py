@@ -1,20 +1,18 @@
+import base64
 import datetime
 from typing import Annotated
-from fastapi import APIRouter, Depends, Form, Request, Query, HTTPException, Body
-from sqlmodel import SQLModel, create_engine, Session, Field, select
+from anyio import from_thread
+from fastapi import APIRouter, Depends, Form, Request, Response, Query, HTTPException, Body
+from sqlmodel import SQLModel, Session, Field, select
+from sqlalchemy.exc import IntegrityError
 from pydantic import EmailStr
-from starlette.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
-from passlib.context import CryptContext
-from contextlib import asynccontextmanager
-from os.path import relpath
-from fastapi.staticfiles import StaticFiles
-from .no_sql_db import redis_client
-
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-templates = Jinja2Templates(directory=['html_templates', 'app/html_templates', '../app/html_templates'])
+from starlette.responses import HTMLResponse, StreamingResponse
+from .page_content import page_content
+from .token_cache import token_cache_sync
+from .hashing import pwd_context, password_hasher
+from .sql_db import get_session, SessionDep
+from .templating import templates
+from .rate_limit import password_rate_limit
 
 
 class UserBase(SQLModel):
@@ -27,7 +25,9 @@ class UserBase(SQLModel):
 
 class User(UserBase, table=True):
     id: int | None = Field(default=None, primary_key=True)
-    username: str
+    # Уникальные индексы: поиск при логине и проверке токена идёт по индексу, а не полным просмотром таблицы
+    username: str = Field(index=True, unique=True)
+    usermail: EmailStr | None = Field(default=None, index=True, unique=True)
     hashed_password: str
 
 
@@ -35,6 +35,10 @@ class UserPublic(UserBase):
     id: int
 
 
+class UserExport(UserPublic):
+    username: str
+
+
 class UserCreate(UserBase):
     username: str
     password: str
@@ -45,37 +49,25 @@ class UserUpdate(UserBase):
     password: str | None = None
 
 
-sqlite_file_name = "database.db"
-
-sqlite_url = f"sqlite:///{sqlite_file_name}"
-
-engine = create_engine(sqlite_url)
-
-
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
-
-
-def get_session():
-    with Session(engine) as session:
-        yield session
-
-
-SessionDep = Annotated[Session, Depends(get_session)]
-
-
-@asynccontextmanager
-async def lifespan(router: APIRouter):
-    create_db_and_tables()
-    yield
+def commit_or_conflict(session: Session):
+    """
+Функция фиксации изменений пользователя. Нарушение уникальности логина или почты превращается в ответ 409.
+    :param session: Сессия
+    """
+    try:
+        session.commit()
+    except IntegrityError:
+        session.rollback()
+        raise HTTPException(status_code=409, detail="User with this username or email already exists")
 
 
-router = APIRouter(tags=['База данных'], lifespan=lifespan)
+router = APIRouter(tags=['База данных'])
 
-router.mount('/static_files', StaticFiles(directory=relpath(f'{relpath(__file__)}/../../static_files')), name='static')
+# Сколько строк за раз читается из БД при выгрузке пользователей
+EXPORT_BATCH_SIZE = 1000
 
 
-@router.post("/reg/", response_class=HTMLResponse)
+@router.post("/reg/", response_class=HTMLResponse, dependencies=[Depends(password_rate_limit)])
 def create_user(user: Annotated[UserCreate, Form()], session: SessionDep, request: Request):
     """
 Функция создает пользователя и добавляет его в базу данных.
@@ -84,32 +76,77 @@ def create_user(user: Annotated[UserCreate, Form()], session: SessionDep, reques
     :param request: Запрос. Требуется для Jinja2 для создания шаблона
     :return: Шаблон Jinja2, говорящий об успешной регистрации
     """
-    hashed_password = pwd_context.hash(user.password)
+    hashed_password = password_hasher.hash_sync(user.password)
     extra_data = {"hashed_password": hashed_password}
     db_user = User.model_validate(user, update=extra_data)
     session.add(db_user)
-    session.commit()
+    commit_or_conflict(session)
     session.refresh(db_user)
-    return templates.TemplateResponse(request=request, name="notification.html", context={
-        "message": redis_client.hget('successful_registration_page', 'message')
-    })
+    # Обработчик синхронный и выполняется в пуле потоков - корутину запускаем в цикле событий приложения
+    content = from_thread.run(page_content.get, 'successful_registration')
+    return templates.TemplateResponse(request=request, name="notification.html", context={**content})
+
+
+def encode_cursor(last_id: int) -> str:
+    """ Непрозрачный курсор страницы: клиент передаёт его обратно, не разбирая """
+    return base64.urlsafe_b64encode(f"id:{last_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        prefix, _, last_id = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().partition(":")
+        if prefix != "id":
+            raise ValueError(cursor)
+        return int(last_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 
 # Работает. Не реализована
 @router.get("/users/", response_model=list[User])
 def read_users(
         session: SessionDep,
-        offset: int = 0,
-        limit: Annotated[int, Query(le=100)] = 100,
+        request: Request,
+        response: Response,
+        cursor: str | None = None,
+        limit: Annotated[int, Query(ge=1, le=100)] = 100,
 ):
     """
 Функция получения списка всех пользователей со всеми полями. Функция работает, но пока не реализована на практике.
 В случае реализации параметр response_model следует указать как list[UserPublic] в целях безопасности.
+Пагинация по ключу (id > последнего id): стоимость страницы не зависит от её номера. Курсор следующей
+страницы возвращается в заголовках X-Next-Cursor и Link.
     """
-    users = session.exec(select(User).offset(offset).limit(limit)).all()
+    statement = select(User).order_by(User.id).limit(limit)
+    if cursor is not None:
+        statement = statement.where(User.id > decode_cursor(cursor))
+    users = session.exec(statement).all()
+    if len(users) == limit:
+        next_cursor = encode_cursor(users[-1].id)
+        response.headers["X-Next-Cursor"] = next_cursor
+        next_url = request.url.include_query_params(cursor=next_cursor, limit=limit)
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
     return users
 
 
+@router.get("/users/export", response_class=StreamingResponse)
+def export_users(session: SessionDep):
+    """
+Функция выгрузки всех пользователей в формате NDJSON (один JSON-объект на строку) за один запрос.
+Строки читаются с сервера порциями, поэтому расход памяти не зависит от размера таблицы.
+    """
+    def generate():
+        # Зависимость закрывает сессию до начала отправки тела, поэтому генератор закрывает её сам
+        try:
+            statement = select(User).order_by(User.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+            for user in session.exec(statement):
+                yield UserExport.model_validate(user).model_dump_json() + "\n"
+        finally:
+            session.close()
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
 # Работает. Не реализована. Не поддерживается HTML5 формой.
 @router.patch("/users/{user_id}")
 def update_user(
@@ -127,11 +164,14 @@ def update_user(
     extra_data = {}
     if "password" in user_data:
         password = user_data["password"]
-        hashed_password = pwd_context.hash(password)
+        hashed_password = password_hasher.hash_sync(password)
         extra_data["hashed_password"] = hashed_password
+    username = user_db.username
     user_db.sqlmodel_update(user_data, update=extra_data)
     session.add(user_db)
-    session.commit()
+    commit_or_conflict(session)
+    # Токены, выданные под прежним именем, больше не должны считаться проверенными ни в одном процессе
+    from_thread.run(token_cache_sync.invalidate_user, username)
     session.refresh(user_db)
     return user_db
 
@@ -148,4 +188,5 @@ def delete_user(user_id: int, session: SessionDep):
         raise HTTPException(status_code=404, detail="Oops.. User not found")
     session.delete(user)
     session.commit()
+    from_thread.run(token_cache_sync.invalidate_user, user.username)
     return {"ok": True}
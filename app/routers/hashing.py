@@ -0,0 +1,133 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from ..config import settings
+from .metrics import (password_hash_duration, password_hash_latency, password_hash_in_progress,
+                      password_hash_rejected)
+
+# Контекст PassLib. Используется для хэширования и проверки паролей.
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def hash_password(password: str) -> str:
+    """
+Хэширование пароля в текущем процессе (блокирует его на время bcrypt). Выполняется в дочерних процессах
+пула PasswordHasher и в собственном пуле процессов массового импорта пользователей.
+    """
+    return pwd_context.hash(password)
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    # Выполняется в дочернем процессе пула
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def _timed(fn, *args) -> tuple:
+    # Выполняется в дочернем процессе пула: время самой операции bcrypt, без ожидания в очереди
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+class PasswordHasher:
+    """
+Хэширование и проверка паролей в отдельном пуле процессов. bcrypt занимает ~200 мс процессорного времени,
+поэтому в цикле событий он останавливает обслуживание всех запросов. Число ожидающих операций ограничено:
+при переполнении очереди запрос сразу получает 503, а не ждёт минутами во время волны логинов.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._total_seconds = 0.0
+        self._max_seconds = 0.0
+
+    def _submit(self, operation: str, fn, *args) -> Future:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                password_hash_rejected.inc()
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Password hashing queue is full",
+                    headers={"Retry-After": "1"},
+                )
+            if self._executor is None:
+                # spawn: дочерние процессы не наследуют потоки и цикл событий родителя
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            self._pending += 1
+        password_hash_in_progress.inc()
+        started = time.perf_counter()
+        try:
+            future = self._executor.submit(_timed, fn, *args)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            password_hash_in_progress.dec()
+            raise
+        future.add_done_callback(lambda done: self._done(operation, done, time.perf_counter() - started))
+        return future
+
+    def _done(self, operation: str, future: Future, seconds: float):
+        with self._lock:
+            self._pending -= 1
+            self._completed += 1
+            self._total_seconds += seconds
+            self._max_seconds = max(self._max_seconds, seconds)
+        password_hash_in_progress.dec()
+        password_hash_latency.observe(seconds, operation)
+        if not future.cancelled() and future.exception() is None:
+            password_hash_duration.observe(future.result()[1], operation)
+
+    async def hash(self, password: str) -> str:
+        """ Хэширование пароля без блокировки цикла событий """
+        result, _ = await asyncio.wrap_future(self._submit('hash', hash_password, password))
+        return result
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """ Проверка пароля без блокировки цикла событий """
+        result, _ = await asyncio.wrap_future(self._submit('verify', _verify, plain_password, hashed_password))
+        return result
+
+    def hash_sync(self, password: str) -> str:
+        """ Хэширование пароля из синхронного обработчика (он выполняется в пуле потоков) """
+        return self._submit('hash', hash_password, password).result()[0]
+
+    def stats(self) -> dict:
+        """ Текущая глубина очереди и задержка операций (с учётом ожидания в очереди) """
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_latency_ms": round(self._total_seconds / self._completed * 1000, 1) if self._completed else 0.0,
+                "max_latency_ms": round(self._max_seconds * 1000, 1),
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHasher(
+    workers=settings.password_hash_workers or os.cpu_count() or 1,
+    max_pending=settings.password_hash_max_pending,
+)
@@ -0,0 +1,234 @@
+"""
+Метрики приложения в текстовом формате Prometheus (эндпоинт GET /metrics).
+
+Счётчики и гистограммы хранятся в памяти процесса. Запись значения - это захват блокировки и несколько
+арифметических операций, поэтому метрики можно не отключать в продакшене. При запуске нескольких процессов
+каждый из них отдаёт свои значения, а суммирует их Prometheus.
+"""
+import bisect
+import threading
+import time
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Границы корзин гистограмм, сек: запросы HTTP и bcrypt - миллисекунды и секунды, Redis и SQL - микросекунды
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BACKEND_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class Metric:
+    """ Базовый класс метрики: имя, описание, имена меток и значения по наборам меток """
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values = {}
+        REGISTRY.append(self)
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}')
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, *label_values) -> float:
+        return self._values.get(label_values, 0)
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (), buckets=HTTP_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *label_values):
+        # Счётчики по корзинам хранятся без накопления; накопленные суммы считаются только при выводе
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                state = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def count(self, *label_values) -> int:
+        state = self._values.get(label_values)
+        return sum(state[0]) if state else 0
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            values = {labels: (list(counts), total) for labels, (counts, total) in self._values.items()}
+        for label_values, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip([*self.buckets, '+Inf'], counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == '+Inf' else f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}')
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+REGISTRY: list[Metric] = []
+
+http_requests = Counter(
+    'http_requests_total', 'Число обработанных HTTP-запросов', ('method', 'route', 'status'))
+http_request_duration = Histogram(
+    'http_request_duration_seconds', 'Время обработки HTTP-запроса', ('method', 'route'))
+http_requests_in_progress = Gauge(
+    'http_requests_in_progress', 'Число HTTP-запросов, обрабатываемых в данный момент', ('method',))
+redis_commands = Counter(
+    'redis_commands_total', 'Число команд Redis, включая команды внутри конвейеров', ('command',))
+redis_command_duration = Histogram(
+    'redis_command_duration_seconds', 'Время обращения к Redis (одиночная команда или конвейер целиком)',
+    ('command',), buckets=BACKEND_BUCKETS)
+sql_statements = Counter(
+    'sql_statements_total', 'Число выполненных SQL-запросов', ('engine', 'statement'))
+sql_statement_duration = Histogram(
+    'sql_statement_duration_seconds', 'Время выполнения SQL-запроса', ('engine', 'statement'),
+    buckets=BACKEND_BUCKETS)
+password_hash_duration = Histogram(
+    'password_hash_duration_seconds', 'Время работы bcrypt в процессе пула (без ожидания в очереди)',
+    ('operation',))
+password_hash_latency = Histogram(
+    'password_hash_latency_seconds', 'Время операции bcrypt с учётом ожидания в очереди пула', ('operation',))
+password_hash_in_progress = Gauge(
+    'password_hash_in_progress', 'Число операций bcrypt в очереди и в работе')
+password_hash_rejected = Counter(
+    'password_hash_rejected_total', 'Число операций bcrypt, отклонённых из-за переполнения очереди (ответ 503)')
+circuit_breaker_open = Gauge(
+    'circuit_breaker_open', 'Разомкнут ли выключатель (1 - обращения к сервису не выполняются)', ('breaker',))
+circuit_breaker_rejected = Counter(
+    'circuit_breaker_rejected_total', 'Число обращений, не выполненных из-за разомкнутого выключателя', ('breaker',))
+page_content_stale_served = Counter(
+    'page_content_stale_served_total', 'Число ответов с последней удачной копией контента вместо данных Redis',
+    ('document',))
+rate_limit_decisions = Counter(
+    'rate_limit_decisions_total', 'Решения ограничителя частоты запросов: allowed, limited или error (Redis недоступен)',
+    ('limiter', 'result'))
+
+
+def render_metrics() -> str:
+    return '\n'.join(line for metric in REGISTRY for line in metric.render()) + '\n'
+
+
+def instrument_engine(engine: Engine, name: str):
+    """
+Подключение счётчиков SQL-запросов к движку SQLAlchemy
+    :param engine: Синхронный движок (для асинхронного - его sync_engine)
+    :param name: Значение метки engine, например sync или async
+    """
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info['metrics_started'].pop()
+        # Тип запроса (SELECT, INSERT, PRAGMA...) вместо полного текста: число меток не зависит от запросов
+        kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'EMPTY'
+        sql_statements.inc(name, kind)
+        sql_statement_duration.observe(seconds, name, kind)
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        started = context.connection.info.get('metrics_started') if context.connection is not None else None
+        if started:
+            started.pop()
+
+
+def route_label(scope: Scope) -> str:
+    """ Шаблон пути (/users/{user_id}), а не сам путь: иначе каждый id давал бы отдельный ряд метрик """
+    route = scope.get('route')
+    if route is not None:
+        return route.path
+    if scope.get('endpoint') is not None:
+        # Подключённое приложение (app.mount), например статические файлы
+        return scope.get('root_path', '')[len(scope.get('app_root_path', '')):] or scope['path']
+    return 'unmatched'
+
+
+class MetricsMiddleware:
+    """ ASGI-middleware, замеряющее время обработки и число одновременных HTTP-запросов """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        method = scope['method']
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        http_requests_in_progress.inc(method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            seconds = time.perf_counter() - started
+            http_requests_in_progress.dec(method)
+            route = route_label(scope)
+            http_requests.inc(method, route, str(status_code))
+            http_request_duration.observe(seconds, method, route)
+
+
+router = APIRouter(tags=['Мониторинг'])
+
+
+@router.get('/metrics', response_class=PlainTextResponse)
+async def get_metrics():
+    """ Эндпоинт метрик в текстовом формате Prometheus """
+    return PlainTextResponse(render_metrics(), media_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,8 +1,18 @@
-import redis
+import logging
+import time
+from contextlib import asynccontextmanager
+
+import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
 from ..config import settings
+from .metrics import redis_commands, redis_command_duration
+from .circuit_breaker import CircuitBreaker
+
+logger = logging.getLogger(__name__)
 
-# Подключение к redis
-redis_client = redis.Redis(
+# Общий пул соединений с Redis. BlockingConnectionPool не открывает больше max_connections соединений:
+# при исчерпании пула запрос ждёт свободное соединение не дольше redis_pool_timeout секунд.
+redis_pool = redis.BlockingConnectionPool(
     # Хост для развертывания без контейнеризации
     host=settings.redis_host,
     # Хости для развертывания с контейнеризвцией (Docker)
@@ -10,57 +20,67 @@ redis_client = redis.Redis(
     port=settings.redis_port,
     db=0,
     decode_responses=True,
-    password=settings.redis_password
+    password=settings.redis_password,
+    max_connections=settings.redis_max_connections,
+    timeout=settings.redis_pool_timeout,
+    socket_timeout=settings.redis_socket_timeout,
+    socket_connect_timeout=settings.redis_connect_timeout,
+    health_check_interval=settings.redis_health_check_interval,
 )
 
-# redis://redis@localhost:6379/0
-
-# Запись словаря по ключу
-# redis_client.hset('user-session:123', mapping={
-#     'name': 'John',
-#     "surname": 'Smith',
-#     "company": 'Redis',
-#     "age": 36,
-# })
-
-# Запись списка по ключу
-# redis_client.lpush('my_list', 'orange', 'apple', 'watermelon')
-
-# Чтение словаря по ключу
-# data = redis_client.hgetall('user-session:123')
-
-# Чтение списка по ключу
-# data_2 = redis_client.lrange('my_list', 0, -1)
-
-# Запись списка по ключу. Альтернативный вариант
-# redis_client.lpush('index_page_nav', ", ".join(index_page_nav))
-
-
-
-# for i in index_page_nav:
-#     redis_client.lpush('index_page_nav', i)
-#
-# for i in index_page_about:
-#     redis_client.lpush('index_page_about', i)
-#
-# for i in barsik_page_nav:
-#     redis_client.lpush('barsik_page_nav', i)
-#
-# for i in barsik_page_about:
-#     redis_client.lpush('barsik_page_about', i)
-#
-# for i in marsik_page_nav:
-#     redis_client.lpush('marsik_page_nav', i)
-#
-# for i in marsik_page_about:
-#     redis_client.lpush('marsik_page_about', i)
-#
-# for i in bonus_page_nav:
-#     redis_client.lpush('bonus_page_nav', i)
-#
-# for i in bonus_page_about:
-#     redis_client.lpush('bonus_page_about', i)
-
-# res = redis_client.get('settings_changed')
-# redis_client.rpush('marsik_page_nav_verif', 'О Барсике', 'На главную', 'Кусь Барсика', 'Настройки', 'Log Out')
-# print(res)
\ No newline at end of file
+
+class InstrumentedPipeline(Pipeline):
+    """ Конвейер, записывающий в метрики число команд и время всего обращения к Redis """
+
+    async def execute(self, raise_on_error: bool = True):
+        for args, _ in self.command_stack:
+            redis_commands.inc(str(args[0]).upper())
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            redis_command_duration.observe(time.perf_counter() - started, 'PIPELINE')
+
+
+class InstrumentedRedis(redis.Redis):
+    """ Клиент Redis, записывающий в метрики число и время выполнения команд """
+
+    async def execute_command(self, *args, **options):
+        command = str(args[0]).upper()
+        redis_commands.inc(command)
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            redis_command_duration.observe(time.perf_counter() - started, command)
+
+    def pipeline(self, transaction: bool = True, shard_hint: str | None = None) -> InstrumentedPipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+# Асинхронный клиент Redis. Все обращения к нему нужно ожидать (await), чтобы не блокировать цикл событий.
+redis_client = InstrumentedRedis(connection_pool=redis_pool)
+
+# Общий выключатель обращений к Redis: отказ любого из них (ошибка или превышение бюджета) учитывается для всех
+redis_breaker = CircuitBreaker(
+    'redis',
+    probe=redis_client.ping,
+    failure_threshold=settings.redis_breaker_failures,
+    reset_timeout=settings.redis_breaker_reset,
+    errors=(redis.RedisError,),
+)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """ Открывает соединение с Redis при старте приложения и закрывает пул при остановке """
+    try:
+        await redis_client.ping()
+    except redis.RedisError as exc:
+        # Приложение стартует и без Redis: соединение будет установлено при первом запросе
+        logger.warning('Redis недоступен при старте приложения: %s', exc)
+    yield
+    await redis_client.aclose()
+    await redis_pool.disconnect()
+
+# Контент страниц загружается в Redis командой python -m app.content_loader (см. app/content_loader.py)
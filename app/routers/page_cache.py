@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Hashable, Iterable
+
+import redis.asyncio as redis
+
+logger = logging.getLogger(__name__)
+
+# Канал для явной инвалидации кэша: сообщение - имя страницы (например, 'index') или '*'
+INVALIDATION_CHANNEL = 'page_content:invalidate'
+
+# Флаги keyspace-уведомлений: K - keyspace-канал, g - общие команды (DEL, EXPIRE...), $ - строки, l - списки, h - хеши
+KEYSPACE_EVENTS = 'Kg$lh'
+
+
+class PageCache:
+    """
+Кэш документов страниц в памяти процесса. Записи живут не дольше ttl секунд и сбрасываются досрочно
+по сообщениям из Redis pub/sub. Одновременные промахи по одному ключу приводят только к одной загрузке.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: dict[Hashable, tuple[float, Any, frozenset[str]]] = {}
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        # Последнее удачно загруженное значение каждого ключа. Не сбрасывается ни по ttl, ни инвалидацией:
+        # это запасная копия на время недоступности Redis
+        self._last_good: dict[Hashable, Any] = {}
+        # Ключи Redis, от которых зависело последнее загруженное значение каждого ключа кэша
+        self._dependencies: dict[Hashable, frozenset[str]] = {}
+        # Поколение увеличивается при каждой инвалидации. Загрузка, начатая до инвалидации, не попадает в кэш.
+        self._generation = 0
+        # Слушатель подписан на уведомления: изменения ключей сейчас не теряются
+        self.subscribed = False
+        self._disconnected = False
+
+    async def get(
+            self,
+            key: Hashable,
+            loader: Callable[[], Awaitable[Any]],
+            depends_on: frozenset[str] | Callable[[Any], frozenset[str]] = frozenset(),
+    ) -> Any:
+        """
+Функция получения значения из кэша
+    :param key: Ключ записи, например ('index', False). Первый элемент - имя страницы
+    :param loader: Корутинная функция загрузки значения при промахе
+    :param depends_on: Ключи Redis, изменение которых сбрасывает запись, или функция, получающая их
+        по загруженному значению (когда ключи становятся известны только после загрузки)
+    :return: Закэшированное или только что загруженное значение
+        """
+        value = self._lookup(key)
+        if value is not None:
+            return value
+        refill = self._inflight.get(key)
+        if refill is None:
+            refill = asyncio.ensure_future(self._refill(key, loader, depends_on))
+            self._inflight[key] = refill
+            refill.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Отмена одного из ожидающих запросов не должна прерывать общую загрузку
+        return await asyncio.shield(refill)
+
+    async def _refill(
+            self,
+            key: Hashable,
+            loader: Callable[[], Awaitable[Any]],
+            depends_on: frozenset[str] | Callable[[Any], frozenset[str]],
+    ) -> Any:
+        generation = self._generation
+        value = await loader()
+        if callable(depends_on):
+            depends_on = depends_on(value)
+        self._dependencies[key] = depends_on
+        if generation == self._generation:
+            self._entries[key] = (time.monotonic() + self.ttl, value, depends_on)
+        self._last_good[key] = value
+        return value
+
+    def stale(self, key: Hashable) -> Any:
+        """ Последнее удачно загруженное значение ключа, даже устаревшее (None - значения не было) """
+        return self._last_good.get(key)
+
+    def _lookup(self, key: Hashable) -> Any:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+    def invalidate(self, page: str | None = None):
+        """
+Функция сброса записей кэша
+    :param page: Имя страницы. Если не указано, сбрасывается весь кэш
+        """
+        self._generation += 1
+        if page is None:
+            self._entries.clear()
+            return
+        for key in [key for key in self._entries if key[0] == page]:
+            del self._entries[key]
+
+    def invalidate_key(self, redis_key: str):
+        """ Функция сброса записей, зависящих от указанного ключа Redis """
+        affected = [key for key, entry in self._entries.items() if redis_key in entry[2]]
+        # Идущая загрузка могла прочитать ключ до изменения. Её ключи известны по прошлой загрузке,
+        # а ключ кэша, который ещё ни разу не загружался, считается зависящим от любого ключа
+        loading = any(redis_key in self._dependencies.get(key, (redis_key,)) for key in self._inflight)
+        if not affected and not loading:
+            # Изменение постороннего ключа не должно отбрасывать идущие загрузки
+            return
+        self._generation += 1
+        for key in affected:
+            del self._entries[key]
+
+    def handle_message(self, message: dict):
+        """ Обработчик сообщений pub/sub: явной инвалидации и keyspace-уведомлений """
+        if message['type'] not in ('message', 'pmessage'):
+            return
+        channel = message['channel']
+        if channel.startswith('__keyspace@'):
+            self.invalidate_key(channel.split(':', 1)[1])
+        else:
+            page = message['data']
+            self.invalidate(None if page == '*' else page)
+
+    def listen(
+            self,
+            client: redis.Redis,
+            db: int = 0,
+            keys: Iterable[str] = (),
+            prefixes: Iterable[str] = (),
+    ) -> asyncio.Task:
+        """
+Функция запуска фоновой задачи, слушающей уведомления об изменении контента в Redis.
+Правка через redis-cli попадает в keyspace-канал, запись через приложение - в INVALIDATION_CHANNEL.
+    :param client: Клиент Redis
+    :param db: Номер базы Redis, за ключами которой следим
+    :param keys: Ключи контента. Уведомления о прочих ключах (ограничитель частоты, отзыв токенов) не нужны
+    :param prefixes: Префиксы ключей контента (ключи версий)
+    :return: Задача-слушатель. Для остановки её нужно отменить
+        """
+        return asyncio.create_task(self._listen(client, db, tuple(keys), tuple(prefixes)))
+
+    async def _listen(self, client: redis.Redis, db: int, keys: tuple[str, ...], prefixes: tuple[str, ...]):
+        try:
+            current = (await client.config_get('notify-keyspace-events')).get('notify-keyspace-events', '')
+            flags = ''.join(sorted(set(current) | set(KEYSPACE_EVENTS)))
+            await client.config_set('notify-keyspace-events', flags)
+        except redis.RedisError:
+            # На управляемых Redis команда CONFIG бывает запрещена - тогда остаются TTL и явная инвалидация
+            logger.warning('Не удалось включить keyspace-уведомления Redis')
+
+        while True:
+            try:
+                async with client.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(INVALIDATION_CHANNEL, *[f'__keyspace@{db}__:{key}' for key in keys])
+                    if prefixes:
+                        await pubsub.psubscribe(*[f'__keyspace@{db}__:{prefix}*' for prefix in prefixes])
+                    # Изменения, сделанные за время переподключения, потеряны - надёжнее сбросить весь кэш.
+                    # Первая подписка кэш не сбрасывает: его только что заполнил прогрев процесса
+                    if self._disconnected:
+                        self.invalidate()
+                    self.subscribed = True
+                    while True:
+                        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                        if message is not None:
+                            self.handle_message(message)
+            except redis.RedisError as exc:
+                # Кэш сбрасывается после повторной подписки: правки за время переподключения тоже учтутся
+                self.subscribed = False
+                self._disconnected = True
+                logger.warning('Слушатель инвалидации кэша страниц потерял соединение: %s', exc)
+                await asyncio.sleep(1)
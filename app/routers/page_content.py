@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import json
+from typing import NamedTuple
+
+import logging
+
+import redis.asyncio as redis
+from fastapi import HTTPException, status
+
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .metrics import page_content_stale_served
+from .no_sql_db import redis_client, redis_breaker
+from .page_cache import PageCache
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Контент публикуется версиями (python -m app.content_loader): ключи версии имеют префикс page_content:v:<версия>:,
+# а указатель хранит текущую версию. Пока указателя нет, ключи читаются без префикса.
+CONTENT_VERSION_KEY = 'page_content:version'
+CONTENT_KEY_PREFIX = 'page_content:v:'
+
+
+def versioned_key(version: str | None, key: str) -> str:
+    """ Имя ключа Redis с контентом указанной версии """
+    return key if version is None else f'{CONTENT_KEY_PREFIX}{version}:{key}'
+
+
+class ContentField(NamedTuple):
+    """ Поле контекста шаблона и команда Redis, которой оно читается """
+    name: str
+    command: str            # 'get', 'hget' или 'lrange'
+    key: str
+    hash_field: str | None = None
+
+
+class PageDocument(dict):
+    """
+Контекст шаблона с версией контента. Версия - хеш содержимого, она одинакова во всех процессах.
+source_keys - ключи Redis, из которых документ прочитан (с префиксом версии, если она опубликована).
+    """
+
+    def __init__(self, content: dict, source_keys: frozenset[str] = frozenset()):
+        super().__init__(content)
+        self.source_keys = source_keys
+        dump = json.dumps(content, sort_keys=True, ensure_ascii=False).encode()
+        self.version = hashlib.sha1(dump).hexdigest()[:16]
+
+
+def _article_page(page: str, verified: bool, nav_verif: bool = True) -> list[ContentField]:
+    """ Поля типовой страницы-статьи (шаблон index.html) """
+    key = f'{page}_page'
+    nav_key = f'{key}_nav_verif' if verified and nav_verif else f'{key}_nav'
+    return [
+        ContentField('title', 'hget', key, 'title'),
+        ContentField('header', 'hget', key, 'header'),
+        ContentField('nav', 'lrange', nav_key),
+        ContentField('header2', 'hget', key, 'header2'),
+        ContentField('p1', 'hget', key, 'p1'),
+        ContentField('p2', 'hget', key, 'p2'),
+        ContentField('about', 'lrange', f'{key}_about'),
+    ]
+
+
+def _index_page(verified: bool) -> list[ContentField]:
+    fields = _article_page('index', verified)
+    if verified:
+        # У авторизованного пользователя заголовок главной страницы хранится отдельной строкой
+        fields[0] = ContentField('title', 'get', 'index_page_verif')
+    return fields
+
+
+def _bonus_page(verified: bool) -> list[ContentField]:
+    # Бонусная страница доступна только авторизованным, поэтому меню у неё одно
+    return _article_page('bonus', verified, nav_verif=False) + [ContentField('p3', 'hget', 'bonus_page', 'p3')]
+
+
+def _settings_page(title_key: str) -> list[ContentField]:
+    return [
+        ContentField('title', 'get', title_key),
+        ContentField('header', 'get', title_key),
+        ContentField('nav', 'lrange', 'settings_page_nav_verif'),
+        ContentField('about', 'lrange', 'settings_page_about'),
+    ]
+
+
+# Описание всех документов с контентом: имя -> функция, возвращающая поля для варианта (авторизован ли пользователь)
+DOCUMENTS = {
+    'index': _index_page,
+    'barsik': lambda verified: _article_page('barsik', verified),
+    'marsik': lambda verified: _article_page('marsik', verified),
+    'bonus': _bonus_page,
+    'settings': lambda verified: _settings_page('settings_title'),
+    'settings_update': lambda verified: _settings_page('settings_update_title'),
+    'successful_authorization': lambda verified: [
+        ContentField('message', 'hget', 'successful_authorization_page', 'message')],
+    'successful_registration': lambda verified: [
+        ContentField('message', 'hget', 'successful_registration_page', 'message')],
+    'failed_authorization': lambda verified: [
+        ContentField('message_401', 'hget', 'failed_authorization_page', 'message_401'),
+        ContentField('message_404', 'hget', 'failed_authorization_page', 'message_404')],
+    'log_out': lambda verified: [ContentField('message', 'get', 'log_out_message')],
+    'settings_changed': lambda verified: [ContentField('message', 'get', 'settings_changed')],
+}
+
+
+def content_keys() -> frozenset[str]:
+    """ Ключи Redis всех документов без префикса версии """
+    return frozenset(
+        field.key for document in DOCUMENTS.values() for verified in (False, True) for field in document(verified)
+    )
+
+
+class ContentUnavailable(HTTPException):
+    """ Redis недоступен, а запасной копии документа ещё нет (процесс не успел загрузить его ни разу) """
+
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Page content is temporarily unavailable",
+            headers={"Retry-After": "5"},
+        )
+
+
+class PageContentRepository:
+    """
+Репозиторий контента страниц. Всё, что нужно странице, читается из Redis за один MULTI-запрос,
+а результат кэшируется в памяти процесса. Если Redis не ответил в бюджет времени или выключатель
+разомкнут, отдаётся последняя удачно загруженная копия документа.
+    """
+
+    def __init__(
+            self,
+            client: redis.Redis,
+            cache: PageCache,
+            breaker: CircuitBreaker | None = None,
+            budget: float | None = None,
+    ):
+        self.client = client
+        self.cache = cache
+        self.breaker = breaker
+        self.budget = budget
+        # Версия контента, прочитанная последней. Ключи следующей загрузки берутся с её префиксом.
+        self.version: str | None = None
+
+    async def get(self, document: str, verified: bool = False) -> PageDocument:
+        """
+Функция получения контента документа
+    :param document: Имя документа из DOCUMENTS
+    :param verified: Вариант для авторизованного пользователя
+    :return: Контекст для шаблона. Словарь общий для всех запросов - перед изменением его нужно скопировать
+        """
+        fields = DOCUMENTS[document](verified)
+        try:
+            return await self.cache.get(
+                (document, verified),
+                lambda: self._guarded_load(fields),
+                # Зависимости - ключи, из которых документ действительно прочитан, и указатель версии:
+                # правка ключа версии через redis-cli и публикация новой версии сбрасывают запись
+                depends_on=lambda document: document.source_keys | {CONTENT_VERSION_KEY},
+            )
+        except (redis.RedisError, TimeoutError, CircuitOpenError) as exc:
+            stale = self.cache.stale((document, verified))
+            if stale is None:
+                logger.warning('Контент %s недоступен: %r', document, exc)
+                raise ContentUnavailable() from exc
+            page_content_stale_served.inc(document)
+            return stale
+
+    def listen(self) -> asyncio.Task:
+        """ Запуск слушателя изменений только ключей контента: ключей без версии, ключей версий и указателя """
+        return self.cache.listen(
+            self.client, keys=content_keys() | {CONTENT_VERSION_KEY}, prefixes=(CONTENT_KEY_PREFIX,)
+        )
+
+    async def _guarded_load(self, fields: list[ContentField]) -> PageDocument:
+        if self.breaker is None:
+            return await self.load(fields)
+        return await self.breaker.call(lambda: self.load(fields), self.budget)
+
+    async def load(self, fields: list[ContentField]) -> PageDocument:
+        """
+Функция загрузки полей одним конвейером MULTI/EXEC. Вместе с полями читается указатель версии: если
+с прошлой загрузки опубликована новая версия, поля перечитываются уже из неё (один лишний запрос на процесс).
+Прочитанная версия всегда полная: её ключи записаны до переключения указателя.
+        """
+        for _ in range(2):
+            version = self.version
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.get(CONTENT_VERSION_KEY)
+                for field in fields:
+                    key = versioned_key(version, field.key)
+                    if field.command == 'lrange':
+                        pipe.lrange(key, 0, -1)
+                    elif field.command == 'hget':
+                        pipe.hget(key, field.hash_field)
+                    else:
+                        pipe.get(key)
+                current, *values = await pipe.execute()
+            if current == version:
+                break
+            self.version = current
+        return PageDocument(
+            {field.name: value for field, value in zip(fields, values)},
+            frozenset(versioned_key(version, field.key) for field in fields),
+        )
+
+
+page_content = PageContentRepository(
+    redis_client,
+    PageCache(ttl=settings.page_cache_ttl),
+    breaker=redis_breaker,
+    budget=settings.redis_budget_page_content,
+)
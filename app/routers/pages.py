@@ -1,19 +1,38 @@
 from fastapi import APIRouter, Request, Depends, Response, Form, HTTPException
-from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
 from typing import Annotated
+from anyio import from_thread
 from fastapi.security import OAuth2PasswordBearer
-from .safety import verify_token, TokenData, get_user, SessionDep, pwd_context
-from fastapi.staticfiles import StaticFiles
-from os.path import relpath
-from .no_sql_db import redis_client
-from .db import User, UserUpdate
-
-router = APIRouter(tags=['Фронтенд'])
-
-templates = Jinja2Templates(directory=['html_templates', 'app/html_templates', '../app/html_templates'])
-
-router.mount('/static_files', StaticFiles(directory=relpath(f'{relpath(__file__)}/../../static_files')), name='static')
+from .safety import (verify_token, TokenData, CurrentUser, SessionDep, get_settings,
+                     token_from_request, revoke_token)
+from .. import config
+from .hashing import password_hasher
+from contextlib import asynccontextmanager
+from .db import User, UserUpdate, commit_or_conflict
+from .page_content import page_content
+from .response_cache import RenderedPageCache
+from .token_cache import token_cache_sync
+from .templating import templates, precompile
+from ..assets import static_versions
+from ..startup import startup_report
+
+# Кэш отрендеренных страниц для анонимных посетителей
+rendered_pages = RenderedPageCache(min_size=config.settings.compression_min_size)
+
+
+@asynccontextmanager
+async def lifespan(router: APIRouter):
+    # Хэши статических файлов и шаблоны готовятся при старте, а не на первом запросе
+    with startup_report.measure('pages: static_versions'):
+        static_versions()
+    with startup_report.measure('pages: precompile'):
+        precompile()
+    listener = page_content.listen()
+    yield
+    listener.cancel()
+
+
+router = APIRouter(tags=['Фронтенд'], lifespan=lifespan)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
@@ -24,107 +43,67 @@ async def get_index(
 ):
     """ Эндпоинт отображения главного раздела сайта """
     token = request.cookies.get('access-token')
+    content = await page_content.get('index', verified=bool(token))
     if token:
-        return templates.TemplateResponse(request=request, name='index.html', context={
-            "title": redis_client.get('index_page_verif'),
-            "header": redis_client.hget('index_page', 'header'),
-            "nav": redis_client.lrange('index_page_nav_verif', 0, -1),
-            "header2": redis_client.hget('index_page', 'header2'),
-            "p1": redis_client.hget('index_page', 'p1'),
-            "p2": redis_client.hget('index_page', 'p2'),
-            "about": redis_client.lrange('index_page_about', 0, -1)
-
-        })
-    return templates.TemplateResponse(request=request, name="index.html", context={
-        "title": redis_client.hget('index_page', 'title'),
-        "header": redis_client.hget('index_page', 'header'),
-        "nav": redis_client.lrange('index_page_nav', 0, -1),
-        "header2": redis_client.hget('index_page', 'header2'),
-        "p1": redis_client.hget('index_page', 'p1'),
-        "p2": redis_client.hget('index_page', 'p2'),
-        "about": redis_client.lrange('index_page_about', 0, -1)
-    })
+        return templates.TemplateResponse(request=request, name="index.html", context={**content})
+    return rendered_pages.respond(
+        request, ('index', 'anonymous', content.version),
+        lambda: templates.TemplateResponse(request=request, name="index.html", context={**content}),
+    )
 
 
 @router.get('/barsik', response_class=HTMLResponse)
 async def get_barsik_page(request: Request):
     """ Эндпоинт отображения раздела про Барсика """
     token = request.cookies.get('access-token')
+    content = await page_content.get('barsik', verified=bool(token))
     if token:
-        return templates.TemplateResponse(request=request, name="index.html", context={
-            "title": redis_client.hget('barsik_page', 'title'),
-            "header": redis_client.hget('barsik_page', 'header'),
-            "nav": redis_client.lrange('barsik_page_nav_verif', 0, -1),
-            "header2": redis_client.hget('barsik_page', 'header2'),
-            "p1": redis_client.hget('barsik_page', 'p1'),
-            "p2": redis_client.hget('barsik_page', 'p2'),
-            "about": redis_client.lrange('barsik_page_about', 0, -1)
-        })
-    return templates.TemplateResponse(request=request, name="index.html", context={
-        "title": redis_client.hget('barsik_page', 'title'),
-        "header": redis_client.hget('barsik_page', 'header'),
-        "nav": redis_client.lrange('barsik_page_nav', 0, -1),
-        "header2": redis_client.hget('barsik_page', 'header2'),
-        "p1": redis_client.hget('barsik_page', 'p1'),
-        "p2": redis_client.hget('barsik_page', 'p2'),
-        "about": redis_client.lrange('barsik_page_about', 0, -1)
-    })
+        return templates.TemplateResponse(request=request, name="index.html", context={**content})
+    return rendered_pages.respond(
+        request, ('barsik', 'anonymous', content.version),
+        lambda: templates.TemplateResponse(request=request, name="index.html", context={**content}),
+    )
 
 
 @router.get('/marsik', response_class=HTMLResponse)
 async def get_marsik_page(request: Request):
     """ Эндпоинт отображения раздела про Марсика """
     token = request.cookies.get('access-token')
+    content = await page_content.get('marsik', verified=bool(token))
     if token:
-        return templates.TemplateResponse(request=request, name="index.html", context={
-            "title": redis_client.hget('marsik_page', 'title'),
-            "header": redis_client.hget('marsik_page', 'header'),
-            "nav": redis_client.lrange('marsik_page_nav_verif', 0, -1),
-            "header2": redis_client.hget('marsik_page', 'header2'),
-            "p1": redis_client.hget('marsik_page', 'p1'),
-            "p2": redis_client.hget('marsik_page', 'p2'),
-            "about": redis_client.lrange('marsik_page_about', 0, -1)
-        })
-    return templates.TemplateResponse(request=request, name="index.html", context={
-        "title": redis_client.hget('marsik_page', 'title'),
-        "header": redis_client.hget('marsik_page', 'header'),
-        "nav": redis_client.lrange('marsik_page_nav', 0, -1),
-        "header2": redis_client.hget('marsik_page', 'header2'),
-        "p1": redis_client.hget('marsik_page', 'p1'),
-        "p2": redis_client.hget('marsik_page', 'p2'),
-        "about": redis_client.lrange('marsik_page_about', 0, -1)
-    })
+        return templates.TemplateResponse(request=request, name="index.html", context={**content})
+    return rendered_pages.respond(
+        request, ('marsik', 'anonymous', content.version),
+        lambda: templates.TemplateResponse(request=request, name="index.html", context={**content}),
+    )
 
 
 @router.get('/bonus', response_class=HTMLResponse)
-def get_bonus_page(
+async def get_bonus_page(
         request: Request,
         user_token: Annotated[TokenData, Depends(verify_token)],
 ):
     """ Эндпоинт просмотра раздела, требующего авторизации """
     if user_token:
-        return templates.TemplateResponse(request=request, name="index.html", context={
-            "title": redis_client.hget('bonus_page', 'title'),
-            "header": redis_client.hget('bonus_page', 'header'),
-            "nav": redis_client.lrange('bonus_page_nav', 0, -1),
-            "header2": redis_client.hget('bonus_page', 'header2'),
-            "p1": redis_client.hget('bonus_page', 'p1'),
-            "p2": redis_client.hget('bonus_page', 'p2'),
-            "p3": redis_client.hget('bonus_page', 'p3'),
-            "about": redis_client.lrange('bonus_page_about', 0, -1)
-        })
+        # У бонусной страницы одно меню навигации - она доступна только авторизованным
+        content = await page_content.get('bonus')
+        return templates.TemplateResponse(request=request, name="index.html", context={**content})
 
 
 @router.get('/oauth', response_class=HTMLResponse)
 async def get_oauth_page(request: Request):
     """ Эндпоинт отображения окна аутентификации/авторизации с формой  """
-    return templates.TemplateResponse(request=request, name="oauth.html")
+    return rendered_pages.respond(
+        request, ('oauth', 'anonymous'), lambda: templates.TemplateResponse(request=request, name="oauth.html")
+    )
 
 
 @router.get('/reg', response_class=HTMLResponse)
 async def get_reg_page(request: Request):
     """ Эндпоинт отображения окна регистрации с формой """
-    return templates.TemplateResponse(request=request, name="reg.html")
+    return rendered_pages.respond(
+        request, ('reg', 'anonymous'), lambda: templates.TemplateResponse(request=request, name="reg.html")
+    )
 
 
 @router.get('/suc_oauth', response_class=HTMLResponse)
@@ -133,19 +112,22 @@ async def get_suc_oauth_page(
         user_token: Annotated[TokenData, Depends(verify_token)]
 ):
     """ Эндпоинт уведомления об успешной авторизации """
-    return templates.TemplateResponse(request=request, name="notification.html", context={
-        "message": redis_client.hget('successful_authorization_page', 'message')
-    })
+    content = await page_content.get('successful_authorization')
+    return templates.TemplateResponse(request=request, name="notification.html", context={**content})
 
 
 @router.get('/log_out', response_class=HTMLResponse)
 async def log_out(
         request: Request,
-        response: Response
+        response: Response,
+        settings: Annotated[config.Settings, Depends(get_settings)]
 ):
-    response = templates.TemplateResponse(request=request, name='notification.html', context={
-        "message": redis_client.get('log_out_message')
-    })
+    """ Эндпоинт выхода из системы: токен отзывается, а не только удаляется из Cookie """
+    token = token_from_request(request)
+    if token is not None:
+        await revoke_token(settings, token)
+    content = await page_content.get('log_out')
+    response = templates.TemplateResponse(request=request, name='notification.html', context={**content})
     response.delete_cookie(key='access-token')
     return response
 
@@ -153,45 +135,34 @@ async def log_out(
 @router.get('/settings', response_class=HTMLResponse)
 async def get_settings_page(
         request: Request,
-        user_token: Annotated[TokenData, Depends(verify_token)],
-        session: SessionDep):
-    user = get_user(user_token.username, session)
-    if user_token:
-        return templates.TemplateResponse(request=request, name='index.html', context={
-            "title": redis_client.get('settings_title'),
-            "header": redis_client.get('settings_title'),
-            "nav": redis_client.lrange('settings_page_nav_verif', 0, -1),
-            "username": user.username,
-            "usermail": user.usermail,
-            "personal_username": user.personal_username,
-            "sex": user.sex,
-            "birthdate": user.birthdate,
-            "sympathy": user.sympathy,
-            "about": redis_client.lrange('settings_page_about', 0, -1),
-            "user_id": user.id,
-        })
+        user: CurrentUser
+):
+    return templates.TemplateResponse(request=request, name='index.html', context={
+        **await page_content.get('settings'),
+        "username": user.username,
+        "usermail": user.usermail,
+        "personal_username": user.personal_username,
+        "sex": user.sex,
+        "birthdate": user.birthdate,
+        "sympathy": user.sympathy,
+        "user_id": user.id,
+    })
 
 
 @router.get('/settings_update')
 async def get_settings_update_page(
         request: Request,
-        user_token: Annotated[TokenData, Depends(verify_token)],
-        session: SessionDep
+        user: CurrentUser
 ):
-    user = get_user(user_token.username, session)
-    if user_token:
-        return templates.TemplateResponse(request=request, name='index.html', context={
-            "title": redis_client.get('settings_update_title'),
-            "header": redis_client.get('settings_update_title'),
-            "nav": redis_client.lrange('settings_page_nav_verif', 0, -1),
-            "about": redis_client.lrange('settings_page_about', 0, -1),
-            "username": user.username,
-            "usermail": user.usermail,
-            "personal_username": user.personal_username,
-            "birthdate": user.birthdate,
-            "user_id": user.id,
-            "sympathy": user.sympathy,
-        })
+    return templates.TemplateResponse(request=request, name='index.html', context={
+        **await page_content.get('settings_update'),
+        "username": user.username,
+        "usermail": user.usermail,
+        "personal_username": user.personal_username,
+        "birthdate": user.birthdate,
+        "user_id": user.id,
+        "sympathy": user.sympathy,
+    })
 
 
 @router.post("/users/{user_id}")
@@ -211,12 +182,15 @@ def update_user(
     extra_data = {}
     if "password" in user_data:
         password = user_data["password"]
-        hashed_password = pwd_context.hash(password)
+        hashed_password = password_hasher.hash_sync(password)
         extra_data["hashed_password"] = hashed_password
+    username = user_db.username
     user_db.sqlmodel_update(user_data, update=extra_data)
     session.add(user_db)
-    session.commit()
+    commit_or_conflict(session)
+    # Токены, выданные под прежним именем, больше не должны считаться проверенными ни в одном процессе
+    from_thread.run(token_cache_sync.invalidate_user, username)
     session.refresh(user_db)
-    return templates.TemplateResponse(request=request, name="notification.html", context={
-        "message": redis_client.get('settings_changed')
-    })
+    # Обработчик синхронный и выполняется в пуле потоков - корутину запускаем в цикле событий приложения
+    content = from_thread.run(page_content.get, 'settings_changed')
+    return templates.TemplateResponse(request=request, name="notification.html", context={**content})
@@ -0,0 +1,130 @@
+"""
+Выборочное профилирование запросов.
+
+Профилируется доля запросов profile_sample_rate и запросы с заголовком X-Profile, равным profile_header_token.
+Сэмплирующий профайлер pyinstrument раз в profile_interval секунд снимает стек задачи запроса (ожидание Redis
+или БД видно как await), поэтому накладные расходы есть только у выбранных запросов. Профили сохраняются
+в формате speedscope (https://www.speedscope.app) в profile_dir/<маршрут>/, для каждого маршрута хранятся
+только последние profile_max_files файлов.
+
+Синхронные обработчики (def) выполняются в пуле потоков, и их код в профиле не раскрывается.
+"""
+import hmac
+import logging
+import os
+import random
+import re
+import time
+
+from anyio import to_thread
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .metrics import route_label
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'x-profile'
+PROFILE_SUFFIX = '.speedscope.json'
+
+
+def route_directory(route: str) -> str:
+    """ Имя каталога маршрута: /users/{user_id} -> users_user_id """
+    return re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+
+
+def rotate(directory: str, max_files: int):
+    """ Удаляет самые старые профили каталога, оставляя max_files последних """
+    profiles = sorted(name for name in os.listdir(directory) if name.endswith(PROFILE_SUFFIX))
+    for name in profiles[:max(0, len(profiles) - max_files)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            # Файл уже удалил другой процесс
+            pass
+
+
+class ProfilingMiddleware:
+    """ ASGI-middleware, профилирующее выбранные запросы """
+
+    def __init__(
+            self,
+            app: ASGIApp,
+            directory: str,
+            sample_rate: float = 0.0,
+            header_token: str = '',
+            interval: float = 0.001,
+            max_files: int = 20,
+    ):
+        """
+Настройка профилирования
+    :param app: Приложение ASGI
+    :param directory: Каталог для профилей
+    :param sample_rate: Доля профилируемых запросов (0 - только запросы с заголовком)
+    :param header_token: Значение заголовка X-Profile, включающее профилирование запроса (пусто - не проверяется)
+    :param interval: Период снятия стека, сек
+    :param max_files: Сколько последних профилей хранить для каждого маршрута
+        """
+        # Импорт здесь: без включённого профилирования pyinstrument не загружается
+        from pyinstrument import Profiler
+
+        self.app = app
+        self.profiler_class = Profiler
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.header_token = header_token
+        self.interval = interval
+        self.max_files = max_files
+
+    def should_profile(self, scope: Scope) -> bool:
+        if self.header_token:
+            header = Headers(scope=scope).get(PROFILE_HEADER)
+            if header is not None and hmac.compare_digest(header.encode(), self.header_token.encode()):
+                return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http' or not self.should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        profiler = self.profiler_class(interval=self.interval, async_mode='enabled')
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            session = profiler.stop()
+            # Ответ уже отправлен; сериализация и запись файла не занимают цикл событий
+            try:
+                await to_thread.run_sync(self.save, session, route_label(scope), scope['method'], status_code)
+            except Exception:
+                logger.exception('Не удалось сохранить профиль запроса %s', scope['path'])
+
+    def save(self, session, route: str, method: str, status_code: int) -> str:
+        """
+Сохранение профиля запроса
+    :param session: Сессия pyinstrument
+    :param route: Шаблон пути маршрута
+    :param method: Метод запроса
+    :param status_code: Код ответа
+    :return: Путь сохранённого файла
+        """
+        from pyinstrument.renderers import SpeedscopeRenderer
+
+        directory = os.path.join(self.directory, route_directory(route))
+        os.makedirs(directory, exist_ok=True)
+        # Имя начинается с времени, поэтому сортировка по имени - это сортировка по возрасту
+        name = (f'{time.time_ns() // 1000:017d}-{method}-{status_code}-'
+                f'{round(session.duration * 1000)}ms-{os.getpid()}{PROFILE_SUFFIX}')
+        path = os.path.join(directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(SpeedscopeRenderer().render(session))
+        rotate(directory, self.max_files)
+        return path
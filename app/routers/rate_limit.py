@@ -0,0 +1,142 @@
+"""
+Ограничение частоты запросов, запускающих bcrypt (/token, /login, /reg/).
+
+Скользящее окно хранится в Redis: для каждого ключа (IP-адрес клиента, логин) - отсортированное множество
+с временем попыток за последние window секунд. Проверка и запись всех ключей запроса выполняются одним
+Lua-скриптом, поэтому атомарны при любом числе рабочих процессов. Ограничитель подключается как зависимость
+FastAPI и отвечает 429 с заголовком Retry-After до того, как запрос попадёт в пул хэширования.
+"""
+import logging
+import math
+import time
+import uuid
+
+import redis.asyncio as redis
+from fastapi import HTTPException, Request, status
+
+from ..config import settings
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .metrics import rate_limit_decisions
+from .no_sql_db import redis_client, redis_breaker
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_KEY_PREFIX = 'rate_limit:'
+
+# KEYS - ключи окон, ARGV - текущее время (мс), окно (мс), идентификатор попытки и лимиты ключей.
+# Возвращает 0, если попытка записана во все окна, иначе - через сколько мс освободится место в самом полном окне.
+# Отклонённая попытка не записывается: повторы во время блокировки не продлевают её.
+SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local retry_after = 0
+for i, key in ipairs(KEYS) do
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+    if redis.call('ZCARD', key) >= tonumber(ARGV[3 + i]) then
+        local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+        retry_after = math.max(retry_after, tonumber(oldest[2]) + window - now, 1)
+    end
+end
+if retry_after > 0 then
+    return retry_after
+end
+for _, key in ipairs(KEYS) do
+    redis.call('ZADD', key, now, ARGV[3])
+    redis.call('PEXPIRE', key, window)
+end
+return 0
+"""
+
+
+class RateLimiter:
+    """ Зависимость FastAPI: ограничение числа попыток за скользящее окно по IP-адресу клиента и по логину """
+
+    def __init__(
+            self,
+            client: redis.Redis,
+            name: str,
+            window: float,
+            per_ip: int,
+            per_username: int,
+            breaker: CircuitBreaker | None = None,
+            budget: float | None = None,
+    ):
+        """
+Настройка ограничителя
+    :param client: Клиент Redis
+    :param name: Имя ограничителя: часть ключей Redis и метка метрик
+    :param window: Длина окна, сек
+    :param per_ip: Попыток за окно с одного IP-адреса (0 - без ограничения)
+    :param per_username: Попыток за окно для одного логина (0 - без ограничения)
+    :param breaker: Выключатель обращений к Redis
+    :param budget: Бюджет времени проверки, сек
+        """
+        self.name = name
+        self.window = window
+        self.per_ip = per_ip
+        self.per_username = per_username
+        self.breaker = breaker
+        self.budget = budget
+        self._script = client.register_script(SLIDING_WINDOW_SCRIPT)
+
+    def keys(self, ip: str | None, username: str | None) -> dict[str, int]:
+        """ Ключи окон запроса и их лимиты """
+        keys = {}
+        if ip and self.per_ip > 0:
+            keys[f'{RATE_LIMIT_KEY_PREFIX}{self.name}:ip:{ip}'] = self.per_ip
+        if username and self.per_username > 0:
+            keys[f'{RATE_LIMIT_KEY_PREFIX}{self.name}:user:{username}'] = self.per_username
+        return keys
+
+    async def hit(self, ip: str | None, username: str | None) -> float:
+        """
+Запись попытки
+    :param ip: IP-адрес клиента
+    :param username: Логин из формы
+    :return: 0, если попытка разрешена, иначе через сколько секунд можно повторить
+        """
+        keys = self.keys(ip, username)
+        if not keys:
+            return 0
+
+        def run():
+            return self._script(
+                keys=list(keys),
+                args=[int(time.time() * 1000), int(self.window * 1000), uuid.uuid4().hex, *keys.values()],
+            )
+
+        retry_after_ms = await (run() if self.breaker is None else self.breaker.call(run, self.budget))
+        return retry_after_ms / 1000
+
+    async def __call__(self, request: Request):
+        # Форма уже разобрана FastAPI для параметров эндпоинта, повторный вызов берёт её из кэша запроса
+        form = await request.form()
+        username = form.get('username')
+        ip = request.client.host if request.client is not None else None
+        try:
+            retry_after = await self.hit(ip, username if isinstance(username, str) else None)
+        except (redis.RedisError, TimeoutError, CircuitOpenError) as exc:
+            # Без Redis запросы пропускаются: ограничитель не должен останавливать вход в систему
+            rate_limit_decisions.inc(self.name, 'error')
+            logger.warning('Ограничитель частоты %s не работает: %s', self.name, exc)
+            return
+        if retry_after > 0:
+            rate_limit_decisions.inc(self.name, 'limited')
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many attempts",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+        rate_limit_decisions.inc(self.name, 'allowed')
+
+
+# Общий ограничитель логинов и регистраций: все эти эндпоинты расходуют одно и то же процессорное время bcrypt
+password_rate_limit = RateLimiter(
+    redis_client,
+    name='password',
+    window=settings.rate_limit_window,
+    per_ip=settings.rate_limit_per_ip,
+    per_username=settings.rate_limit_per_username,
+    breaker=redis_breaker,
+    budget=settings.redis_budget_rate_limit,
+)
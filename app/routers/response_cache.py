@@ -0,0 +1,88 @@
+import hashlib
+from collections import OrderedDict
+from typing import Callable, Hashable, NamedTuple
+
+from fastapi import Request, Response, status
+
+from .compression import choose_encoding, encode_cached
+
+
+class RenderedPage(NamedTuple):
+    """ Готовый ответ: тело, его ETag, тип содержимого и сжатые копии тела по кодировкам (br, gzip) """
+    body: bytes
+    etag: str
+    media_type: str
+    encoded: dict[str, bytes]
+
+
+def make_etag(body: bytes) -> str:
+    """ Сильный ETag по содержимому ответа. Одинаковое тело даёт одинаковый ETag во всех процессах. """
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+Функция проверки заголовка If-None-Match
+    :param if_none_match: Значение заголовка из запроса
+    :param etag: Текущий ETag ресурса
+    :return: Истина, если у клиента актуальная копия
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # Для If-None-Match используется слабое сравнение: префикс W/ не учитывается
+    return etag in (tag.strip().removeprefix('W/') for tag in if_none_match.split(','))
+
+
+class RenderedPageCache:
+    """
+Кэш отрендеренных страниц, одинаковых для всех анонимных посетителей. Ключ задаёт обработчик:
+маршрут, вариант (авторизован ли пользователь) и версия контента. Хранится не больше max_entries ответов.
+Сжатая копия страницы создаётся при первом запросе с подходящим Accept-Encoding и хранится вместе с исходной.
+    """
+
+    def __init__(self, max_entries: int = 256, min_size: int = 1024):
+        self.max_entries = max_entries
+        self.min_size = min_size
+        self._pages: OrderedDict[Hashable, RenderedPage] = OrderedDict()
+
+    def respond(self, request: Request, key: Hashable, render: Callable[[], Response]) -> Response:
+        """
+Функция ответа из кэша. Если у клиента уже есть актуальная копия, возвращается 304 без тела.
+    :param request: Запрос
+    :param key: Ключ страницы, например ('index', 'anonymous', версия контента)
+    :param render: Функция рендеринга страницы при промахе
+    :return: Ответ с ETag
+        """
+        # Шаблоны строят абсолютные ссылки через url_for, поэтому результат зависит и от адреса сайта
+        full_key = (key, str(request.base_url))
+        page = self._pages.get(full_key)
+        if page is None:
+            response = render()
+            page = RenderedPage(response.body, make_etag(response.body), response.media_type, {})
+            self._pages[full_key] = page
+            if len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+        else:
+            self._pages.move_to_end(full_key)
+        encoding = None
+        if len(page.body) >= self.min_size:
+            encoding = choose_encoding(request.headers.get('accept-encoding', ''))
+        body, etag = page.body, page.etag
+        if encoding is not None:
+            body = page.encoded.get(encoding)
+            if body is None:
+                body = page.encoded[encoding] = encode_cached(page.body, encoding)
+            # У каждого представления свой ETag: "<хэш>-br" для brotli, "<хэш>-gzip" для gzip
+            etag = f'{page.etag[:-1]}-{encoding}"'
+        # no-cache: браузер хранит копию, но перед показом сверяет её по ETag
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        if encoding is not None:
+            headers['Content-Encoding'] = encoding
+        return Response(body, media_type=page.media_type, headers=headers)
+
+    def clear(self):
+        self._pages.clear()
@@ -0,0 +1,176 @@
+"""
+Отзыв JWT-токенов до истечения срока действия (выход из системы).
+
+Отозванный токен хранится в Redis ключом revoked_jti:<jti> со временем жизни до exp токена. Каждый процесс
+держит в памяти фильтр Блума по отозванным jti и получает новые jti через pub/sub. Фильтр не даёт ложноотрицательных
+ответов, поэтому для неотозванного токена (обычный случай) проверка обходится без обращения к Redis, а при
+срабатывании фильтра ответ уточняется в Redis.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from typing import Callable
+
+import redis.asyncio as redis
+
+from ..config import settings
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .no_sql_db import redis_client, redis_breaker
+from .token_cache import token_cache
+
+logger = logging.getLogger(__name__)
+
+REVOKED_KEY_PREFIX = 'revoked_jti:'
+REVOCATION_CHANNEL = 'token_revocation'
+
+
+class BloomFilter:
+    """ Фильтр Блума для строк: size бит и hashes хэш-функций под заданные ёмкость и долю ложных срабатываний """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        # Двойное хэширование: k позиций из двух половин одного дайджеста
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class TokenRevocationList:
+    """ Список отозванных токенов в Redis с локальным фильтром Блума в каждом процессе """
+
+    def __init__(
+            self,
+            client: redis.Redis,
+            capacity: int,
+            error_rate: float,
+            rebuild_interval: float,
+            on_revoke: Callable[[str], None] | None = None,
+            breaker: CircuitBreaker | None = None,
+            budget: float | None = None,
+    ):
+        """
+Настройка списка отозванных токенов
+    :param client: Клиент Redis
+    :param capacity: Ожидаемое число одновременно отозванных (ещё не истёкших) токенов
+    :param error_rate: Доля ложных срабатываний фильтра при capacity записях
+    :param rebuild_interval: Период пересборки фильтра из Redis, сек. Убирает из фильтра истёкшие jti
+    :param on_revoke: Функция, вызываемая с jti каждого отозванного токена (сброс кэша проверенных токенов)
+    :param breaker: Выключатель обращений к Redis для проверки токенов
+    :param budget: Бюджет времени проверки токена в Redis, сек
+        """
+        self.client = client
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.rebuild_interval = rebuild_interval
+        self.on_revoke = on_revoke
+        self.breaker = breaker
+        self.budget = budget
+        self._filter = BloomFilter(capacity, error_rate)
+        # Пока фильтр не загружен из Redis, каждая проверка идёт в Redis
+        self.synced = False
+        self._disconnected = False
+
+    async def revoke(self, jti: str, exp: float):
+        """
+Функция отзыва токена
+    :param jti: Идентификатор токена (поле jti)
+    :param exp: Время истечения токена (Unix time). После него запись в Redis не нужна
+        """
+        ttl = math.ceil(exp - time.time())
+        if ttl <= 0:
+            return
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.set(REVOKED_KEY_PREFIX + jti, 1, ex=ttl)
+            pipe.publish(REVOCATION_CHANNEL, jti)
+            await pipe.execute()
+        self._add(jti)
+
+    async def is_revoked(self, jti: str) -> bool:
+        """ Функция проверки токена. Для неотозванного токена при загруженном фильтре не обращается к Redis. """
+        if self.synced and jti not in self._filter:
+            return False
+        key = REVOKED_KEY_PREFIX + jti
+        try:
+            if self.breaker is None:
+                return bool(await self.client.exists(key))
+            return bool(await self.breaker.call(lambda: self.client.exists(key), self.budget))
+        except (redis.RedisError, TimeoutError, CircuitOpenError) as exc:
+            # Без Redis токен с верной подписью и exp принимается: выход из системы не должен блокировать вход
+            logger.warning('Не удалось проверить отзыв токена: %s', exc)
+            return False
+
+    def _add(self, jti: str):
+        self._filter.add(jti)
+        if self.on_revoke is not None:
+            self.on_revoke(jti)
+
+    async def sync(self, notify: bool = False):
+        """
+Функция пересборки фильтра по ключам Redis: истёкшие jti в новый фильтр не попадают
+    :param notify: Вызвать on_revoke для каждого найденного jti. Нужно после потери подписки: сообщения об отзыве
+    за это время не пришли, и отозванные токены остались бы в кэше проверенных токенов
+        """
+        fresh = BloomFilter(self.capacity, self.error_rate)
+        async for key in self.client.scan_iter(match=REVOKED_KEY_PREFIX + '*', count=1000):
+            jti = key[len(REVOKED_KEY_PREFIX):]
+            fresh.add(jti)
+            if notify and self.on_revoke is not None:
+                self.on_revoke(jti)
+        self._filter = fresh
+        self.synced = True
+
+    def listen(self) -> asyncio.Task:
+        """
+Функция запуска фоновой задачи, загружающей фильтр и получающей новые отозванные jti из pub/sub
+    :return: Задача-слушатель. Для остановки её нужно отменить
+        """
+        return asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        while True:
+            try:
+                async with self.client.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    # Сначала подписка, потом загрузка: jti, отозванные во время загрузки, придут сообщением
+                    await pubsub.subscribe(REVOCATION_CHANNEL)
+                    # При первой подписке кэш проверенных токенов ещё пуст - сбрасывать в нём нечего
+                    await self.sync(notify=self._disconnected)
+                    self._disconnected = False
+                    rebuild_at = time.monotonic() + self.rebuild_interval
+                    while True:
+                        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                        if message is not None:
+                            self._add(message['data'])
+                        if time.monotonic() >= rebuild_at:
+                            await self.sync()
+                            rebuild_at = time.monotonic() + self.rebuild_interval
+            except redis.RedisError as exc:
+                # Пока нет подписки, сообщения теряются - до повторной загрузки проверки идут в Redis
+                self.synced = False
+                self._disconnected = True
+                logger.warning('Слушатель отзыва токенов потерял соединение: %s', exc)
+                await asyncio.sleep(1)
+
+
+# Список отозванных токенов процесса. Отзыв сразу убирает токен и из кэша проверенных токенов.
+token_revocation = TokenRevocationList(
+    redis_client,
+    capacity=settings.token_revocation_capacity,
+    error_rate=settings.token_revocation_error_rate,
+    rebuild_interval=settings.token_revocation_rebuild_interval,
+    on_revoke=token_cache.invalidate_jti,
+    breaker=redis_breaker,
+    budget=settings.redis_budget_token_revocation,
+)
@@ -1,29 +1,37 @@
+import logging
+import uuid
 from contextlib import asynccontextmanager
 from datetime import datetime, timedelta, timezone
 from typing import Annotated, Optional
-from functools import lru_cache
 
 import jwt
 from fastapi import APIRouter, HTTPException, status, Depends, Request
 from fastapi.responses import RedirectResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.security.utils import get_authorization_scheme_param
-from fastapi.templating import Jinja2Templates
 from jwt.exceptions import InvalidTokenError
-from passlib.context import CryptContext
+from redis.exceptions import RedisError
 from pydantic import BaseModel
 from sqlalchemy.exc import InvalidRequestError
-from sqlmodel import create_engine, Session, select, SQLModel
+from sqlmodel import select
 
 from .db import User
+from .hashing import pwd_context, password_hasher
+from .sql_db import (create_db_and_tables, get_session, SessionDep, dispose_engines,
+                     get_async_session, AsyncSessionDep)
+from .token_cache import token_cache, token_cache_sync
+from .revocation import token_revocation
+from .circuit_breaker import CircuitOpenError
+from .rate_limit import password_rate_limit
 from .. import config
+from ..startup import startup_report
 
-templates = Jinja2Templates(directory=['html_templates', 'app/html_templates', '../app/html_templates'])
+logger = logging.getLogger(__name__)
 
 
-@lru_cache
 def get_settings():
-    return config.Settings()
+    # Зависимость отдаёт общие настройки из config: второй экземпляр Settings заново читал бы окружение и .env
+    return config.settings
 
 
 class Token(BaseModel):
@@ -64,57 +72,36 @@ class OAuth2PasswordBearerWithCookie(OAuth2PasswordBearer):
             )
 
 
-# Контекст PassLib. Используется для хэширования и проверки паролей.
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 oauth2_scheme = OAuth2PasswordBearerWithCookie(tokenUrl="token")
 
-sqlite_file_name = "database.db"
-
-sqlite_url = f"sqlite:///{sqlite_file_name}"
-
-engine = create_engine(sqlite_url)
-
-
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
-
-
-def get_session():
-    with Session(engine) as session:
-        yield session
-
 
-SessionDep = Annotated[Session, Depends(get_session)]
-
-
-def get_password_hash(password):
+async def get_password_hash(password):
     """
     :param password: Пароль, поступающий от пользователя
     :return: Хешированный пароль пользователя
     """
-    return pwd_context.hash(password)
+    return await password_hasher.hash(password)
 
 
-def verify_password(plain_password, hashed_password):
+async def verify_password(plain_password, hashed_password):
     """
 Функция проверки соответствия полученного пароля и хранимого хеша
     :param plain_password: Полученный пароль
     :param hashed_password: Хранимый хеш
     :return: Истина или ложь в зависимости от параметров
     """
-    return pwd_context.verify(plain_password, hashed_password)
+    return await password_hasher.verify(plain_password, hashed_password)
 
 
-def get_user(username: str, session: SessionDep):
+async def get_user(username: str, session: AsyncSessionDep):
     """
 Функция получения информации о пользователе из БД
-    :param session: Текущая сессия
+    :param session: Текущая асинхронная сессия
     :param username: Логин для получения по нему
     :return: Запись о пользователе из БД
     """
     try:
-        user = session.exec(select(User).where(User.username == username)).one()
+        user = (await session.exec(select(User).where(User.username == username))).one()
         return user
     except InvalidRequestError:
         raise HTTPException(
@@ -124,17 +111,17 @@ def get_user(username: str, session: SessionDep):
         )
 
 
-def authenticate_user(username: str, password: str, session: SessionDep):
+async def authenticate_user(username: str, password: str, session: AsyncSessionDep):
     """
 Функция аутентификации и возврата пользователя
     :param username: Логин пользователя
     :param password: Пароль пользователя для аутентификации по паролю
     :return: Пользователь (запись из БД)
     """
-    user = get_user(username, session)
+    user = await get_user(username, session)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password(password, user.hashed_password):
         return False
     return user
 
@@ -149,7 +136,8 @@ def create_access_token(
         expire = datetime.now(timezone.utc) + expires_delta
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    # jti - уникальный идентификатор токена, по нему токен отзывается при выходе из системы
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
@@ -158,9 +146,13 @@ async def verify_token(
         settings: Annotated[config.Settings, Depends(get_settings)],
         token: Annotated[str, Depends(oauth2_scheme)],
         request: Request,
-        session: SessionDep
+        session: AsyncSessionDep
 ):
     """ Функция проверки JWT-токена пользователя и возврата токена с username пользователя, если все в порядке. """
+    # Токен, уже проверенный этим процессом, не нужно заново декодировать и искать пользователя в БД
+    username = token_cache.get(token)
+    if username is not None:
+        return TokenData(username=username)
     try:
         payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
         username: str = payload.get("sub")
@@ -177,30 +169,97 @@ async def verify_token(
             detail="Token is invalid",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    user = get_user(token_data.username, session)
+    jti = payload.get("jti")
+    if jti is not None and await token_revocation.is_revoked(jti):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user = await get_user(token_data.username, session)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not find user",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    token_cache.put(token, user.username, payload.get("exp", float("inf")), jti)
+    # Загруженная запись передаётся get_current_user через состояние запроса, чтобы не искать её повторно
+    request.state.user = user
     return token_data
 
 
+async def get_current_user(
+        request: Request,
+        user_token: Annotated[TokenData, Depends(verify_token)],
+        session: AsyncSessionDep
+) -> User:
+    """
+Функция получения пользователя по проверенному токену
+    :param user_token: Токен, проверенный verify_token
+    :param session: Текущая асинхронная сессия
+    :return: Запись о пользователе из БД. Запрос к БД выполняется только если токен взят из кэша
+    """
+    user = getattr(request.state, 'user', None)
+    if user is None or user.username != user_token.username:
+        user = await get_user(user_token.username, session)
+        request.state.user = user
+    return user
+
+
+CurrentUser = Annotated[User, Depends(get_current_user)]
+
+
+def token_from_request(request: Request) -> str | None:
+    """ Токен из заголовка Authorization или из Cookie, без ошибки при его отсутствии """
+    scheme, param = get_authorization_scheme_param(request.headers.get("Authorization"))
+    if scheme.lower() == "bearer" and param:
+        return param
+    return request.cookies.get('access-token')
+
+
+async def revoke_token(settings: config.Settings, token: str):
+    """
+Функция отзыва токена до истечения его срока действия. Недействительный токен и токен без jti пропускаются.
+    :param settings: Настройки приложения
+    :param token: JWT-токен
+    """
+    try:
+        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+    except InvalidTokenError:
+        return
+    if payload.get("jti") is None or payload.get("exp") is None:
+        return
+    try:
+        await token_revocation.revoke(payload["jti"], payload["exp"])
+    except (RedisError, CircuitOpenError) as exc:
+        # Выход из системы не должен падать вместе с Redis: Cookie всё равно удаляется
+        logger.warning('Не удалось отозвать токен: %s', exc)
+
+
 @asynccontextmanager
 async def lifespan(router: APIRouter):
-    create_db_and_tables()
+    # При запуске через app.server схему один раз создаёт главный процесс, а не каждый рабочий
+    if config.settings.create_schema_on_startup:
+        with startup_report.measure('safety: create_db_and_tables'):
+            create_db_and_tables()
+    revocation_listener = token_revocation.listen()
+    token_cache_listener = token_cache_sync.listen()
     yield
+    revocation_listener.cancel()
+    token_cache_listener.cancel()
+    password_hasher.shutdown()
+    await dispose_engines()
 
 
 router = APIRouter(tags=['Безопасность'], lifespan=lifespan)
 
 
-@router.post("/login")
+@router.post("/login", dependencies=[Depends(password_rate_limit)])
 async def validate_login_form(
         request: Request,
         form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-        session: SessionDep,
+        session: AsyncSessionDep,
         settings: Annotated[config.Settings, Depends(get_settings)]
 ):
     """
@@ -220,11 +279,11 @@ async def validate_login_form(
     return response
 
 
-@router.post("/token")
+@router.post("/token", dependencies=[Depends(password_rate_limit)])
 async def login_for_access_token(
         request: Request,
         form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-        session: SessionDep,
+        session: AsyncSessionDep,
         settings: Annotated[config.Settings, Depends(get_settings)]
 ):
     """
@@ -232,7 +291,7 @@ async def login_for_access_token(
 в эндпоинте POST /login
 
     """
-    user = authenticate_user(form_data.username, form_data.password, session)
+    user = await authenticate_user(form_data.username, form_data.password, session)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -248,3 +307,7 @@ async def login_for_access_token(
     return {"access_token": access_token, "token_type": "bearer"}
 
 
+@router.get("/status/password_hashing")
+async def get_password_hashing_status():
+    """ Эндпоинт состояния пула хэширования паролей: глубина очереди, отказы и задержка операций """
+    return password_hasher.stats()
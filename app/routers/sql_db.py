@@ -0,0 +1,173 @@
+import logging
+import threading
+from typing import Annotated
+
+from fastapi import Depends
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlmodel import SQLModel, Session, StaticPool, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from ..config import settings
+from .metrics import instrument_engine
+
+logger = logging.getLogger(__name__)
+
+
+def build_engine(url: str) -> Engine:
+    """
+Функция создания движка БД по настройкам приложения
+    :param url: URL базы данных, например sqlite:///database.db
+    :return: Движок SQLAlchemy с настроенным пулом соединений
+    """
+    parsed = make_url(url)
+    is_sqlite = parsed.get_backend_name() == 'sqlite'
+    if is_sqlite and parsed.database in (None, '', ':memory:'):
+        # База в памяти существует только внутри одного соединения - пул ей не нужен
+        return create_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    engine = create_engine(
+        url,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_pre_ping=not is_sqlite,
+        # Сессии открываются в пуле потоков FastAPI, поэтому соединение SQLite может сменить поток
+        connect_args={"check_same_thread": False} if is_sqlite else {},
+    )
+    if is_sqlite:
+        event.listen(engine, 'connect', _set_sqlite_pragmas)
+    return engine
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+Настройка каждого нового соединения SQLite. В режиме WAL читатели не блокируются писателем,
+а busy_timeout заставляет писателей ждать друг друга вместо ошибки "database is locked".
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+    cursor.close()
+
+
+# Асинхронные драйверы для синхронных URL: для асинхронного движка меняется только драйвер
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+
+def build_async_engine(url: str) -> AsyncEngine:
+    """
+Функция создания асинхронного движка БД для того же URL, что и у синхронного
+    :param url: URL базы данных, например sqlite:///database.db
+    :return: Асинхронный движок SQLAlchemy. Запросы через него не блокируют цикл событий
+    """
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    parsed = parsed.set(drivername=ASYNC_DRIVERS.get(backend, parsed.drivername))
+    if backend == 'sqlite' and parsed.database in (None, '', ':memory:'):
+        return create_async_engine(parsed, poolclass=StaticPool)
+    engine = create_async_engine(
+        parsed,
+        # Для файлов SQLite aiosqlite по умолчанию открывает новое соединение на каждую сессию - задаём пул явно
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_pre_ping=backend != 'sqlite',
+    )
+    if backend == 'sqlite':
+        event.listen(engine.sync_engine, 'connect', _set_sqlite_pragmas)
+    return engine
+
+
+# Движки создаются при первом обращении (прогрев в lifespan), а не при импорте: импорт приложения
+# не загружает драйверы БД и не строит пулы
+_engine: Engine | None = None
+_async_engine: AsyncEngine | None = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> Engine:
+    """ Единственный движок приложения - общий пул соединений для всех роутеров """
+    global _engine
+    if _engine is None:
+        # Первое обращение может прийти одновременно из цикла событий и из пула потоков
+        with _engine_lock:
+            if _engine is None:
+                engine = build_engine(settings.database_url)
+                instrument_engine(engine, 'sync')
+                _engine = engine
+    return _engine
+
+
+def get_async_engine() -> AsyncEngine:
+    """ Асинхронный движок для обработчиков async def. Работает с той же базой, что и get_engine(). """
+    global _async_engine
+    if _async_engine is None:
+        with _engine_lock:
+            if _async_engine is None:
+                engine = build_async_engine(settings.database_url)
+                instrument_engine(engine.sync_engine, 'async')
+                _async_engine = engine
+    return _async_engine
+
+
+async def dispose_engines():
+    """ Закрытие соединений созданных движков при остановке приложения """
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    if _engine is not None:
+        _engine.dispose()
+
+
+def create_db_and_tables():
+    engine = get_engine()
+    SQLModel.metadata.create_all(engine)
+    create_missing_indexes(engine)
+
+
+def create_missing_indexes(bind: Engine):
+    """
+Миграция индексов. create_all не трогает уже существующие таблицы, поэтому индексы, добавленные в модели
+позже (например, уникальные индексы User.username и User.usermail), создаются здесь для старых файлов БД.
+Если данные нарушают уникальность, индекс пропускается, а дубликаты нужно устранить вручную.
+    """
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind, checkfirst=True)
+            except IntegrityError as exc:
+                logger.error('Не удалось создать индекс %s: в таблице %s есть дубликаты (%s)',
+                             index.name, table.name, exc.orig)
+
+
+def get_session():
+    with Session(get_engine()) as session:
+        yield session
+
+
+SessionDep = Annotated[Session, Depends(get_session)]
+
+
+async def get_async_session():
+    # expire_on_commit=False: объекты остаются доступны после commit без повторного запроса к БД
+    async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+        yield session
+
+
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_session)]
+
+
+if __name__ == '__main__':
+    # Ручной запуск миграции: python -m app.routers.sql_db
+    logging.basicConfig(level=logging.INFO)
+    from . import db  # noqa: F401 - регистрирует модели в метаданных
+    create_db_and_tables()
+    logger.info('Схема БД %s актуальна', get_engine().url)
@@ -0,0 +1,47 @@
+"""
+Общее окружение шаблонов Jinja2 для всех роутеров.
+
+Шаблоны ищутся в одном каталоге, а скомпилированный байткод сохраняется на диск (FileSystemBytecodeCache),
+поэтому новый процесс не компилирует шаблоны заново. При старте приложения основные шаблоны загружаются
+заранее (precompile), и первый запрос обслуживается так же быстро, как последующие.
+"""
+import os
+
+from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+from ..assets import register
+from ..config import settings
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'html_templates')
+
+# Шаблоны, которые рендерят обработчики приложения
+PRECOMPILED_TEMPLATES = ('index.html', 'notification.html', 'oauth.html', 'reg.html')
+
+
+def build_environment(directory: str = TEMPLATES_DIR, cache_dir: str | None = settings.template_cache_dir) -> Environment:
+    """
+Функция создания окружения шаблонов
+    :param directory: Каталог шаблонов
+    :param cache_dir: Каталог байткода. Пустая строка или None - временный каталог системы
+    :return: Окружение Jinja2 с автоэкранированием, как у Jinja2Templates по умолчанию
+    """
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    return Environment(
+        loader=FileSystemLoader(directory),
+        bytecode_cache=FileSystemBytecodeCache(cache_dir or None),
+        autoescape=True,
+        # Шаблоны меняются только при деплое: без auto_reload Jinja2 не проверяет файл на каждом рендере
+        auto_reload=False,
+    )
+
+
+templates = Jinja2Templates(env=build_environment())
+register(templates)
+
+
+def precompile() -> None:
+    """ Загрузка основных шаблонов в кэш окружения (при наличии байткода на диске - без компиляции) """
+    for name in PRECOMPILED_TEMPLATES:
+        templates.get_template(name)
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import redis.asyncio as redis
+
+from ..config import settings
+from .no_sql_db import redis_client
+
+logger = logging.getLogger(__name__)
+
+TOKEN_CACHE_CHANNEL = 'token_cache_invalidation'
+
+
+class TokenCache:
+    """
+Ограниченный LRU-кэш проверенных JWT-токенов: токен -> username существующего пользователя.
+Запись удаляется, когда истекает срок действия токена (exp) или ttl кэша, при изменении
+или удалении пользователя, а также при отзыве токена (выходе из системы).
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._tokens: OrderedDict[str, tuple[str, float, str | None]] = OrderedDict()
+        self._by_user: dict[str, set[str]] = {}
+        self._by_jti: dict[str, str] = {}
+        # Кэш используется и из цикла событий, и из синхронных обработчиков в пуле потоков
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> str | None:
+        """
+Функция получения пользователя по ранее проверенному токену
+    :param token: JWT-токен
+    :return: username или None, если токена нет в кэше или срок его действия истёк
+        """
+        with self._lock:
+            entry = self._tokens.get(token)
+            if entry is None:
+                return None
+            username, expires_at, _ = entry
+            if expires_at <= time.time():
+                self._remove(token)
+                return None
+            self._tokens.move_to_end(token)
+            return username
+
+    def put(self, token: str, username: str, exp: float, jti: str | None = None):
+        """
+Функция сохранения проверенного токена
+    :param token: JWT-токен
+    :param username: Пользователь, которому выдан токен
+    :param exp: Время истечения токена (Unix time, поле exp)
+    :param jti: Идентификатор токена (поле jti), по нему токен удаляется при отзыве
+        """
+        with self._lock:
+            if token in self._tokens:
+                self._remove(token)
+            self._tokens[token] = (username, min(exp, time.time() + self.ttl), jti)
+            self._by_user.setdefault(username, set()).add(token)
+            if jti is not None:
+                self._by_jti[jti] = token
+            while len(self._tokens) > self.max_entries:
+                self._remove(next(iter(self._tokens)))
+
+    def invalidate_user(self, username: str):
+        """ Функция удаления всех токенов пользователя. Вызывается при изменении и удалении пользователя """
+        with self._lock:
+            for token in list(self._by_user.get(username, ())):
+                self._remove(token)
+
+    def invalidate_jti(self, jti: str):
+        """ Функция удаления отозванного токена по его jti """
+        with self._lock:
+            token = self._by_jti.get(jti)
+            if token is not None:
+                self._remove(token)
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+            self._by_user.clear()
+            self._by_jti.clear()
+
+    def _remove(self, token: str):
+        username, _, jti = self._tokens.pop(token)
+        if jti is not None:
+            self._by_jti.pop(jti, None)
+        tokens = self._by_user.get(username)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._by_user[username]
+
+
+class TokenCacheSync:
+    """
+Рассылка сброса токенов пользователя кэшам всех рабочих процессов через pub/sub Redis.
+Без неё пользователь, изменённый или удалённый в одном процессе, оставался бы проверенным
+в остальных до истечения ttl кэша.
+    """
+
+    def __init__(self, cache: TokenCache, client: redis.Redis):
+        self.cache = cache
+        self.client = client
+        self.subscribed = False
+
+    async def invalidate_user(self, username: str):
+        """ Функция удаления токенов пользователя из кэша этого процесса и остальных процессов """
+        self.cache.invalidate_user(username)
+        try:
+            await self.client.publish(TOKEN_CACHE_CHANNEL, username)
+        except redis.RedisError as exc:
+            # Остальные процессы не получат сообщение, но при восстановлении подписки очистят кэш целиком
+            logger.warning('Не удалось разослать сброс токенов пользователя: %s', exc)
+
+    def listen(self) -> asyncio.Task:
+        """
+Функция запуска фоновой задачи, получающей сбросы токенов от других процессов
+    :return: Задача-слушатель. Для остановки её нужно отменить
+        """
+        return asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        while True:
+            try:
+                async with self.client.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(TOKEN_CACHE_CHANNEL)
+                    # Сообщения, пришедшие без подписки, потеряны: кэш очищается после каждого подключения
+                    self.cache.clear()
+                    self.subscribed = True
+                    while True:
+                        message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                        if message is not None:
+                            self.cache.invalidate_user(message['data'])
+            except redis.RedisError as exc:
+                self.subscribed = False
+                logger.warning('Слушатель сброса кэша токенов потерял соединение: %s', exc)
+                await asyncio.sleep(1)
+
+
+# Кэш проверенных токенов процесса
+token_cache = TokenCache(max_entries=settings.token_cache_size, ttl=settings.token_cache_ttl)
+token_cache_sync = TokenCacheSync(token_cache, redis_client)
@@ -0,0 +1,66 @@
+"""
+Запуск приложения в продакшене: несколько рабочих процессов uvicorn на одном сокете.
+
+Главный процесс один раз создаёт схему БД, открывает сокет и запускает рабочие процессы. Каждый рабочий процесс
+до приёма соединений выполняет lifespan: компилирует шаблоны, открывает соединения с Redis и БД и загружает
+контент страниц (app.warmup). Пока процесс прогревается, запросы обслуживают остальные процессы.
+Сигнал SIGHUP главному процессу перезапускает рабочие процессы по одному.
+
+Запуск: python -m app.server [--workers 4] [--host 0.0.0.0] [--port 8000]
+"""
+import argparse
+import logging
+import os
+
+import uvicorn
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def worker_count(configured: int) -> int:
+    """ Число рабочих процессов: из настроек или по числу ядер """
+    return configured if configured > 0 else os.cpu_count() or 1
+
+
+def prepare_schema():
+    """ Создание таблиц и индексов. Выполняется один раз в главном процессе, до запуска рабочих. """
+    from .routers import db  # noqa: F401 - регистрирует модели в метаданных
+    from .routers.sql_db import create_db_and_tables, get_engine
+
+    create_db_and_tables()
+    # Рабочие процессы открывают свои соединения, соединения главного процесса больше не нужны
+    get_engine().dispose()
+
+
+def worker_environment(workers: int) -> dict[str, str]:
+    """ Переменные окружения рабочих процессов (настройки в них читаются заново) """
+    environment = {'CREATE_SCHEMA_ON_STARTUP': 'false'}
+    if not settings.password_hash_workers:
+        # Пул bcrypt есть в каждом рабочем процессе: делим ядра между ними, а не создаём workers * ядер процессов
+        environment['PASSWORD_HASH_WORKERS'] = str(max(1, (os.cpu_count() or 1) // workers))
+    return environment
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=settings.server_workers,
+                        help='Число рабочих процессов (0 - по числу ядер)')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    workers = worker_count(args.workers)
+    prepare_schema()
+    # С proxy_headers адрес клиента (request.client) берётся из X-Forwarded-For доверенного прокси (nginx):
+    # по нему работает ограничение частоты логинов
+    os.environ.update(worker_environment(workers))
+    logger.info('Запуск %d рабочих процессов на %s:%d', workers, args.host, args.port)
+    uvicorn.run('app.main:app', host=args.host, port=args.port, workers=workers, proxy_headers=True,
+                forwarded_allow_ips=settings.forwarded_allow_ips)
+
+
+if __name__ == '__main__':
+    main()
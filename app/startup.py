@@ -0,0 +1,118 @@
+"""
+Отчёт о времени старта процесса приложения.
+
+В процессе: время импорта app.main и шагов инициализации в lifespan (хэши статики, шаблоны, схема БД, прогрев).
+Отчёт пишется в лог, когда процесс готов принимать запросы.
+
+Из командной строки: разбивка времени импорта app.main по модулям в отдельном (холодном) процессе
+через python -X importtime.
+
+Запуск: python -m app.startup [--top 25] [--budget-ms 3000]
+"""
+import argparse
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+# Строка вывода -X importtime: "import time:  self [us] | cumulative | имя модуля с отступом по вложенности"
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+
+class StartupReport:
+    """ Длительности шагов старта процесса в порядке выполнения """
+
+    def __init__(self):
+        # Экземпляр создаётся первым импортом app.main - от этого момента считается время импорта
+        self.created = time.perf_counter()
+        self.steps: list[tuple[str, float]] = []
+
+    def record(self, name: str, seconds: float):
+        self.steps.append((name, seconds))
+
+    @contextmanager
+    def measure(self, name: str):
+        """ Замер шага: with startup_report.measure('pages: precompile'): ... """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def render(self) -> str:
+        total = sum(seconds for _, seconds in self.steps)
+        lines = [f'Старт процесса {os.getpid()}: {total * 1000:.0f} мс']
+        lines += [f'  {name}: {seconds * 1000:.1f} мс' for name, seconds in self.steps]
+        return '\n'.join(lines)
+
+    def log(self):
+        logger.info(self.render())
+
+
+startup_report = StartupReport()
+
+
+class ImportTime(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(output: str) -> list[ImportTime]:
+    """ Разбор вывода python -X importtime """
+    rows = []
+    for line in output.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            # Модуль верхнего уровня идёт после одного пробела, каждый уровень вложенности добавляет два
+            rows.append(ImportTime(module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return rows
+
+
+def measure_imports(module: str = 'app.main') -> list[ImportTime]:
+    """ Импорт модуля в новом процессе с -X importtime: кэш модулей текущего процесса не искажает замер """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    return parse_importtime(result.stderr)
+
+
+def by_package(rows: list[ImportTime]) -> dict[str, int]:
+    """ Собственное время импорта (мкс), сложенное по пакетам верхнего уровня; модули app - по отдельности """
+    totals: dict[str, int] = {}
+    for row in rows:
+        name = row.module if row.module.startswith('app.') else row.module.split('.')[0]
+        totals[name] = totals.get(name, 0) + row.self_us
+    return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='app.main', help='Импортируемый модуль')
+    parser.add_argument('--top', type=int, default=25, help='Сколько пакетов показать')
+    parser.add_argument('--budget-ms', type=float, help='Допустимое время импорта; при превышении код выхода 1')
+    args = parser.parse_args(argv)
+
+    rows = measure_imports(args.module)
+    total_ms = next(row.cumulative_us for row in rows if row.module == args.module) / 1000
+    print(f'импорт {args.module}: {total_ms:.0f} мс, модулей: {len(rows)}')
+    for name, self_us in list(by_package(rows).items())[:args.top]:
+        print(f'{self_us / 1000:8.1f} мс  {name}')
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f'превышен бюджет {args.budget_ms:.0f} мс', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+Прогрев процесса приложения перед приёмом запросов.
+
+uvicorn начинает принимать соединения только после завершения lifespan, поэтому всё, что сделано здесь,
+не достаётся первым запросам: соединения с Redis и БД уже открыты, контент страниц лежит в кэше процесса.
+"""
+import asyncio
+import logging
+import time
+from contextlib import ExitStack
+
+from sqlalchemy import text
+
+from .config import settings
+from .routers.no_sql_db import redis_client
+from .routers.page_content import DOCUMENTS, page_content
+from .routers.sql_db import get_async_engine, get_engine
+
+logger = logging.getLogger(__name__)
+
+
+async def warm_redis(connections: int):
+    # Одновременные PING занимают разные соединения пула - открываются сразу connections соединений
+    await asyncio.gather(*(redis_client.ping() for _ in range(connections)))
+
+
+def warm_db(connections: int):
+    with ExitStack() as stack:
+        for _ in range(connections):
+            stack.enter_context(get_engine().connect()).execute(text('SELECT 1'))
+
+
+async def warm_async_db(connections: int):
+    engine = get_async_engine()
+
+    async def connect():
+        connection = await engine.connect()
+        try:
+            await connection.execute(text('SELECT 1'))
+        except BaseException:
+            await connection.close()
+            raise
+        return connection
+
+    # Соединения удерживаются, пока открываются остальные, иначе пул отдал бы уже открытое повторно.
+    # Ошибка одного соединения не должна оставлять остальные занятыми: все открытые возвращаются в пул.
+    results = await asyncio.gather(*(connect() for _ in range(connections)), return_exceptions=True)
+    for result in results:
+        if not isinstance(result, BaseException):
+            await result.close()
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+
+async def warm_page_content(concurrency: int):
+    # Не больше concurrency загрузок одновременно: хватает уже открытых соединений пула
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def load(document: str, verified: bool):
+        async with semaphore:
+            await page_content.get(document, verified)
+
+    await asyncio.gather(*(load(document, verified) for document in DOCUMENTS for verified in (False, True)))
+
+
+async def _step(name: str, awaitable):
+    try:
+        await awaitable
+    except Exception as exc:
+        logger.warning('Прогрев %s не выполнен: %s', name, exc)
+
+
+async def warm_up(connections: int = settings.warmup_connections):
+    """
+Функция прогрева: открывает соединения пулов Redis и БД и загружает контент всех страниц.
+Ошибка одного из шагов не мешает запуску: недостающее будет загружено первым запросом.
+    :param connections: Сколько соединений открыть в каждом пуле
+    """
+    started = time.perf_counter()
+    if connections > 0:
+        await asyncio.gather(
+            _step('redis', warm_redis(connections)),
+            _step('db', asyncio.to_thread(warm_db, min(connections, settings.db_pool_size))),
+            _step('async_db', warm_async_db(min(connections, settings.db_pool_size))),
+        )
+    # Контент загружается после открытия соединений и использует их же
+    await _step('page_content', warm_page_content(connections))
+    logger.info('Прогрев процесса занял %.0f мс', (time.perf_counter() - started) * 1000)
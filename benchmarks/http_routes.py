@@ -0,0 +1,296 @@
+"""
+Нагрузочный замер HTTP-маршрутов приложения.
+
+Поднимает app.main:app в отдельном процессе uvicorn. Вместо Redis используется fakeredis (TCP-сервер в этом процессе)
+с контентом всех страниц, вместо рабочей БД - временный файл SQLite с заданным числом пользователей.
+Для каждого маршрута выполняется --requests запросов: --concurrency задач asyncio в одном цикле событий
+отправляют их одновременно через общий httpx.AsyncClient. Результат (req/s и задержки p50/p95/p99)
+печатается в формате JSON. Если задан --baseline, результат сравнивается с сохранённым:
+падение req/s или рост p95 больше чем на --tolerance считается регрессией, и команда завершается с кодом 1.
+
+Запуск:   python -m benchmarks.http_routes --users 10000 --baseline benchmarks/baseline.json
+Эталон:   python -m benchmarks.http_routes --users 10000 --output benchmarks/baseline.json
+Эталон зависит от машины, поэтому сравнивать имеет смысл только замеры, снятые на одной и той же машине.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+
+import httpx
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+USERNAME = 'user0'
+PASSWORD = 'bench-password'
+
+# Заголовки страниц: по ним шаблон index.html выбирает разметку
+TITLES = {
+    'index_page': 'Барсик и Марсик',
+    'index_page_verif': 'Барсик и Марсик',
+    'barsik_page': 'Барсик',
+    'marsik_page': 'Марсик',
+    'bonus_page': 'Бонусный контент',
+    'settings_title': 'Настройки',
+    'settings_update_title': 'Изменение учетных данных пользователя',
+}
+NAV = ['На главную', 'О Барсике', 'О Марсике', 'Для авторизованных', 'Войти в систему']
+NAV_VERIF = ['На главную', 'О Барсике', 'О Марсике', 'Кусь Барсика', 'Настройки', 'Log Out']
+ABOUT = ['Барсик', 'Марсик', 'Рацион котов', 'Фотографии', 'Бонусный контент']
+PARAGRAPH = ('Барсик и Марсик живут вместе уже несколько лет. Днём они спят на подоконнике, вечером гоняют '
+             'друг друга по квартире, а ночью требуют еды. ') * 4
+MESSAGE = 'Операция выполнена успешно'
+
+
+@dataclass
+class Route:
+    method: str
+    path: str
+    auth: bool = False
+    form: dict | None = None
+    # Доля от --requests: bcrypt в /token слишком медленный для полного числа запросов
+    share: float = 1.0
+
+
+ROUTES = {
+    'index': Route('GET', '/'),
+    'index_verified': Route('GET', '/', auth=True),
+    'barsik': Route('GET', '/barsik'),
+    'oauth': Route('GET', '/oauth'),
+    'bonus': Route('GET', '/bonus', auth=True),
+    'token': Route('POST', '/token', form={'username': USERNAME, 'password': PASSWORD}, share=0.1),
+    'users': Route('GET', '/users/?limit=100'),
+    'static_css': Route('GET', '/static_files/style.css'),
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_redis(port: int):
+    """ TCP-сервер fakeredis в фоновом потоке: приложение подключается к нему как к обычному Redis """
+    from fakeredis import TcpFakeServer
+    server = TcpFakeServer(('127.0.0.1', port), server_type='redis')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def seed_content(port: int):
+    """ Публикует в Redis контент всех документов из page_content.DOCUMENTS (как python -m app.content_loader) """
+    import redis
+
+    from app.content_loader import publish
+    from app.routers.page_content import DOCUMENTS
+
+    content = {}
+    for document in DOCUMENTS.values():
+        for verified in (False, True):
+            for field in document(verified):
+                if field.command == 'lrange':
+                    content[field.key] = NAV_VERIF if field.key.endswith('_nav_verif') else \
+                        NAV if field.key.endswith('_nav') else ABOUT
+                elif field.command == 'hget':
+                    value = TITLES.get(field.key, PARAGRAPH) if field.hash_field == 'title' else PARAGRAPH
+                    content.setdefault(field.key, {})[field.hash_field] = value
+                else:
+                    content[field.key] = TITLES.get(field.key, MESSAGE)
+    client = redis.Redis(port=port, decode_responses=True)
+    publish(client, content)
+    client.close()
+
+
+def seed_users(database_url: str, count: int):
+    """ Создаёт схему и count пользователей. Хэш пароля один на всех: bcrypt для каждого занял бы минуты. """
+    from sqlalchemy import insert
+    from sqlmodel import SQLModel
+
+    from app.routers.db import User
+    from app.routers.hashing import pwd_context
+    from app.routers.sql_db import build_engine, create_missing_indexes
+
+    engine = build_engine(database_url)
+    SQLModel.metadata.create_all(engine)
+    create_missing_indexes(engine)
+    hashed_password = pwd_context.hash(PASSWORD)
+    with engine.begin() as connection:
+        for start in range(0, count, 10_000):
+            connection.execute(insert(User), [
+                {'username': f'user{i}', 'usermail': f'user{i}@example.com', 'hashed_password': hashed_password}
+                for i in range(start, min(start + 10_000, count))
+            ])
+    engine.dispose()
+
+
+def start_server(port: int, env: dict, workers: int) -> subprocess.Popen:
+    command = [sys.executable, '-m', 'uvicorn', 'app.main:app', '--host', '127.0.0.1', '--port', str(port),
+               '--log-level', 'warning', '--workers', str(workers)]
+    server = subprocess.Popen(command, cwd=PROJECT_DIR, env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'uvicorn завершился с кодом {server.returncode}')
+        try:
+            if httpx.get(f'http://127.0.0.1:{port}/oauth').status_code == 200:
+                return server
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('uvicorn не запустился за 60 секунд')
+
+
+def percentile(values: list[float], q: float) -> float:
+    """ Процентиль q (0-100) по методу ближайшего ранга. values должны быть отсортированы. """
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+async def run_route(client: httpx.AsyncClient, route: Route, requests: int, concurrency: int, token: str) -> dict:
+    headers = {'Authorization': f'Bearer {token}'} if route.auth else {}
+    latencies = []
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            response = await client.request(route.method, route.path, headers=headers, data=route.form)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, requests))))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+async def run(base_url: str, routes: list[str], requests: int, concurrency: int, warmup: int) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        response = await client.post('/token', data={'username': USERNAME, 'password': PASSWORD})
+        response.raise_for_status()
+        token = response.json()['access_token']
+        results = {}
+        for name in routes:
+            route = ROUTES[name]
+            count = max(1, round(requests * route.share))
+            # Прогрев: заполнение кэшей процесса и пулов соединений не должно попадать в замер
+            await run_route(client, route, max(1, round(warmup * route.share)), concurrency, token)
+            results[name] = await run_route(client, route, count, concurrency, token)
+            print(f'{name:>15}: {results[name]["rps"]:8.1f} req/s  p95 {results[name]["p95_ms"]:8.2f} мс',
+                  file=sys.stderr)
+        return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+Функция сравнения замера с эталоном
+    :param results: Текущий замер: маршрут -> метрики
+    :param baseline: Эталонный замер в том же формате
+    :param tolerance: Допустимое ухудшение, доля (0.2 - на 20%)
+    :return: Описания регрессий. Пустой список - регрессий нет.
+    """
+    regressions = []
+    for name, current in results.items():
+        if current['errors']:
+            regressions.append(f'{name}: {current["errors"]} ответов с ошибкой')
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if current['rps'] < expected['rps'] * (1 - tolerance):
+            regressions.append(f'{name}: {current["rps"]} req/s против {expected["rps"]} в эталоне')
+        if current['p95_ms'] > expected['p95_ms'] * (1 + tolerance):
+            regressions.append(f'{name}: p95 {current["p95_ms"]} мс против {expected["p95_ms"]} в эталоне')
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10_000, help='Число пользователей в файле SQLite')
+    parser.add_argument('--requests', type=int, default=500, help='Число замеряемых запросов на маршрут')
+    parser.add_argument('--warmup', type=int, default=50, help='Число прогревочных запросов на маршрут')
+    parser.add_argument('--concurrency', type=int, default=16, help='Число одновременных запросов')
+    parser.add_argument('--workers', type=int, default=1, help='Число процессов uvicorn')
+    parser.add_argument('--routes', nargs='+', choices=list(ROUTES), default=list(ROUTES))
+    parser.add_argument('--output', help='Файл для сохранения результата в формате JSON')
+    parser.add_argument('--baseline', help='Файл эталонного замера для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.3, help='Допустимое ухудшение относительно эталона')
+    args = parser.parse_args(argv)
+
+    redis_port, app_port = free_port(), free_port()
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        env = {
+            **os.environ,
+            'SECRET_KEY': os.environ.get('SECRET_KEY', 'benchmark-secret'),
+            'ALGORITHM': os.environ.get('ALGORITHM', 'HS256'),
+            'ACCESS_TOKEN_EXPIRE_MINUTES': '60',
+            'REDIS_HOST': '127.0.0.1',
+            'REDIS_PORT': str(redis_port),
+            'REDIS_PASSWORD': '',
+            'DOCKER_REDIS_HOST': '127.0.0.1',
+            'DATABASE_URL': database_url,
+            # Все запросы идут с одного адреса: ограничение частоты логинов исказило бы замер bcrypt
+            'RATE_LIMIT_PER_IP': '0',
+            'RATE_LIMIT_PER_USERNAME': '0',
+        }
+        # Настройки приложения читаются при импорте, поэтому окружение задаётся до импорта app
+        os.environ.update(env)
+        fake_redis = start_fake_redis(redis_port)
+        seed_content(redis_port)
+        seed_users(database_url, args.users)
+        server = start_server(app_port, env, args.workers)
+        try:
+            routes = asyncio.run(run(f'http://127.0.0.1:{app_port}', args.routes, args.requests,
+                                     args.concurrency, args.warmup))
+        finally:
+            server.terminate()
+            server.wait()
+            fake_redis.shutdown()
+
+    report = {
+        'meta': {
+            'users': args.users, 'requests': args.requests, 'concurrency': args.concurrency,
+            'workers': args.workers, 'python': platform.python_version(), 'cpus': os.cpu_count(),
+        },
+        'routes': routes,
+    }
+    print(json.dumps(report, indent=1, ensure_ascii=False))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=1, ensure_ascii=False)
+            file.write('\n')
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as file:
+            baseline = json.load(file)['routes']
+        regressions = compare(routes, baseline, args.tolerance)
+        for regression in regressions:
+            print(f'РЕГРЕССИЯ {regression}', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""
+Замер поиска пользователя по логину (как в get_user) до и после миграции индексов.
+
+Запуск: python -m benchmarks.user_lookup --users 100000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import text
+from sqlmodel import Session, SQLModel, select
+
+from app.routers.db import User
+from app.routers.sql_db import build_engine, create_missing_indexes
+
+
+def fill_users(engine, count: int):
+    """ Создаёт таблицу user в старом виде (без индексов) и заполняет её count пользователями """
+    with engine.begin() as connection:
+        connection.execute(text(
+            'CREATE TABLE user (usermail VARCHAR, personal_username VARCHAR, sex VARCHAR, birthdate DATE, '
+            'sympathy VARCHAR, id INTEGER PRIMARY KEY, username VARCHAR NOT NULL, hashed_password VARCHAR NOT NULL)'
+        ))
+        connection.execute(
+            text('INSERT INTO user (username, usermail, hashed_password) VALUES (:username, :usermail, :hashed)'),
+            [{"username": f"user{i}", "usermail": f"user{i}@example.com", "hashed": "x"} for i in range(count)],
+        )
+
+
+def measure(engine, count: int, lookups: int) -> float:
+    """ Среднее время одного запроса select(User).where(User.username == ...) в микросекундах """
+    names = [f"user{random.randrange(count)}" for _ in range(lookups)]
+    with Session(engine) as session:
+        started = time.perf_counter()
+        for name in names:
+            session.exec(select(User).where(User.username == name)).one()
+        return (time.perf_counter() - started) / lookups * 1e6
+
+
+def query_plan(engine) -> str:
+    with engine.connect() as connection:
+        rows = connection.execute(text("EXPLAIN QUERY PLAN SELECT * FROM user WHERE username = 'user1'")).all()
+    return '; '.join(row[-1] for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100_000, help='Число пользователей в таблице')
+    parser.add_argument('--lookups', type=int, default=200, help='Число замеряемых запросов')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = build_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        fill_users(engine, args.users)
+        before = measure(engine, args.users, args.lookups)
+        print(f'без индекса:  {before:10.1f} мкс/запрос  ({query_plan(engine)})')
+        SQLModel.metadata.create_all(engine)
+        create_missing_indexes(engine)
+        after = measure(engine, args.users, args.lookups)
+        print(f'с индексом:   {after:10.1f} мкс/запрос  ({query_plan(engine)})')
+        print(f'ускорение:    {before / after:10.1f}x на {args.users} пользователях')
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+import os
+import tempfile
+
+import pytest
+import redis
+import redis.asyncio as async_redis
+
+# База приложения подменяется до первого импорта app: lifespan тестового клиента создаёт таблицы и индексы,
+# и без подмены они оказались бы в рабочем database.db. Каталог удаляется при завершении процесса
+_database_dir = tempfile.TemporaryDirectory(prefix='pet1-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_database_dir.name, 'database.db')}"
+
+from app.config import settings  # noqa: E402
+from app.routers.rate_limit import RATE_LIMIT_KEY_PREFIX, SLIDING_WINDOW_SCRIPT  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    # Асинхронные тесты (pytest.mark.anyio) выполняются в цикле asyncio, как и приложение
+    return 'asyncio'
+
+
+@pytest.fixture(name='redis_options')
+def redis_options_fixture() -> dict:
+    """ Параметры подключения к тому же Redis, что и у приложения """
+    return {
+        'host': settings.redis_host,
+        'port': settings.redis_port,
+        'password': settings.redis_password or None,
+        'decode_responses': True,
+    }
+
+
+@pytest.fixture(name='sync_redis_client')
+def sync_redis_client_fixture(redis_options: dict):
+    client = redis.Redis(**redis_options)
+    yield client
+    client.close()
+
+
+@pytest.fixture(name='redis_client')
+async def redis_client_fixture(redis_options: dict):
+    client = async_redis.Redis(**redis_options)
+    yield client
+    await client.aclose()
+
+
+@pytest.fixture(name='reset_rate_limits')
+def reset_rate_limits_fixture(sync_redis_client: redis.Redis):
+    """
+Окна ограничителя частоты не переносятся между тестами: все тестовые запросы идут с одного адреса.
+Подключается в модулях, которые отправляют формы входа и регистрации в приложение.
+    """
+    keys = list(sync_redis_client.scan_iter(match=RATE_LIMIT_KEY_PREFIX + '*'))
+    if keys:
+        sync_redis_client.delete(*keys)
+    # Скрипт загружается заранее: тестовый fakeredis-сервер обрывает соединение вместо ответа NOSCRIPT
+    sync_redis_client.script_load(SLIDING_WINDOW_SCRIPT)
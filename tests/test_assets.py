@@ -0,0 +1,154 @@
+import gzip
+import os
+
+from fastapi import FastAPI, Request
+from fastapi.templating import Jinja2Templates
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.assets import MANIFEST_NAME, VARIANTS_DIR, PrecompressedStaticFiles, accepted_encodings, build, \
+    publish, register, static_versions, IMMUTABLE_CACHE_CONTROL
+
+CSS = b'body { color: black; }\n' * 50
+
+
+def make_static(tmp_path):
+    (tmp_path / 'page').mkdir()
+    Image.new('RGB', (600, 300), 'orange').save(tmp_path / 'page' / 'cat.jpg')
+    (tmp_path / 'style.css').write_bytes(CSS)
+    return tmp_path
+
+
+def test_build_creates_variants_and_manifest(tmp_path):
+    static = make_static(tmp_path)
+    manifest = build(str(static))
+    entry = manifest['page/cat.jpg']
+    assert (entry['width'], entry['height']) == (600, 300)
+    assert [w for w, _ in entry['sources']['image/webp']] == [240, 480, 600]
+    # Самый широкий вариант исходного формата - сам оригинал
+    assert entry['sources']['image/jpeg'][-1] == [600, 'page/cat.jpg']
+    for candidates in entry['sources'].values():
+        for _, variant in candidates:
+            assert (static / variant).is_file()
+    with Image.open(static / VARIANTS_DIR / 'page' / 'cat-240.jpg') as small:
+        assert small.size == (240, 120)
+    assert (static / VARIANTS_DIR / MANIFEST_NAME).is_file()
+    assert gzip.decompress((static / 'style.css.gz').read_bytes()) == CSS
+    assert (static / 'style.css.br').is_file()
+
+
+def test_build_skips_fresh_variants(tmp_path):
+    static = make_static(tmp_path)
+    build(str(static))
+    variant = static / VARIANTS_DIR / 'page' / 'cat-240.webp'
+    mtime = os.path.getmtime(variant)
+    build(str(static))
+    assert os.path.getmtime(variant) == mtime
+
+
+def test_accepted_encodings():
+    assert accepted_encodings('gzip, deflate, br;q=0.9') == {'gzip', 'deflate', 'br'}
+    assert accepted_encodings('br;q=0, gzip') == {'gzip'}
+    assert accepted_encodings('') == set()
+
+
+def test_precompressed_static_files(tmp_path):
+    static = make_static(tmp_path)
+    build(str(static))
+    app = FastAPI()
+    app.mount('/static_files', PrecompressedStaticFiles(directory=str(static)), name='static')
+    client = TestClient(app)
+
+    response = client.get('/static_files/style.css', headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['content-encoding'] == 'br'
+    assert response.headers['content-type'].startswith('text/css')
+    assert response.headers['vary'] == 'Accept-Encoding'
+    assert response.content == CSS
+
+    response = client.get('/static_files/style.css', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['content-encoding'] == 'gzip'
+    assert response.content == CSS
+
+    response = client.get('/static_files/style.css', headers={'Accept-Encoding': 'identity'})
+    assert 'content-encoding' not in response.headers
+    assert response.headers['vary'] == 'Accept-Encoding'
+    assert response.content == CSS
+
+    # Изображения без сжатых копий отдаются как обычно
+    response = client.get('/static_files/page/cat.jpg', headers={'Accept-Encoding': 'gzip, br'})
+    assert response.status_code == 200
+    assert 'content-encoding' not in response.headers
+
+
+def render(tmp_path, monkeypatch, template: str, manifest: dict | None = None) -> str:
+    """ Рендер шаблона со static_url и picture для статических файлов из tmp_path """
+    app = FastAPI()
+    app.mount('/static_files', PrecompressedStaticFiles(directory=str(tmp_path)), name='static')
+    (tmp_path / 'page.html').write_text(template, encoding='utf-8')
+    templates = Jinja2Templates(directory=str(tmp_path))
+    register(templates)
+
+    @app.get('/')
+    def page(request: Request):
+        return templates.TemplateResponse(request=request, name='page.html')
+
+    monkeypatch.setattr('app.assets.load_manifest', lambda: manifest or {})
+    monkeypatch.setattr('app.assets.static_versions', lambda static_dir=None: static_versions(str(tmp_path)))
+    return TestClient(app).get('/').text
+
+
+def test_picture(tmp_path, monkeypatch):
+    static = make_static(tmp_path)
+    manifest = build(str(static))
+    built, plain = render(
+        tmp_path, monkeypatch, "{{ picture('/page/cat.jpg', 'Кот') }}|{{ picture('/other.png') }}", manifest
+    ).split('|')
+    versions = static_versions(str(static))
+    assert built.startswith('<picture><source type="image/avif"')
+    assert f"/static_files/_variants/page/cat-240.webp?v={versions['_variants/page/cat-240.webp']} 240w" in built
+    assert f"<img title='Кот' src=\"http://testserver/static_files/page/cat.jpg?v={versions['page/cat.jpg']}\"" in built
+    # Изображения без записи в манифесте выводятся обычным <img>
+    assert plain == "<img title='' src=\"http://testserver/static_files/other.png\"/>"
+
+
+def test_picture_skips_missing_variants(tmp_path, monkeypatch):
+    static = make_static(tmp_path)
+    manifest = build(str(static))
+    for variant in (static / VARIANTS_DIR / 'page').glob('cat-*.avif'):
+        variant.unlink()
+    (static / VARIANTS_DIR / 'page' / 'cat-240.webp').unlink()
+    html = render(tmp_path, monkeypatch, "{{ picture('/page/cat.jpg') }}", manifest)
+    # <source> с отсутствующими файлами не выводится: браузер не перешёл бы от него к <img>
+    assert 'image/avif' not in html
+    assert 'cat-240.webp' not in html
+    assert 'cat-480.webp' in html
+
+
+def test_publish_copies_built_files(tmp_path):
+    (tmp_path / 'static').mkdir()
+    static = make_static(tmp_path / 'static')
+    build(str(static))
+    target = tmp_path / 'public'
+    (target / 'old').mkdir(parents=True)
+    (target / 'old' / 'removed.css').write_text('')
+    copied = publish(str(target), str(static))
+    assert (target / VARIANTS_DIR / 'page' / 'cat-240.webp').is_file()
+    assert (target / 'style.css.gz').read_bytes() == (static / 'style.css.gz').read_bytes()
+    assert not (target / 'old' / 'removed.css').exists()
+    # Неизменившиеся файлы повторно не копируются
+    assert copied > 0 and publish(str(target), str(static)) == 0
+
+
+def test_static_url_and_immutable_caching(tmp_path, monkeypatch):
+    static = make_static(tmp_path)
+    url = render(tmp_path, monkeypatch, "{{ static_url('/style.css') }}")
+    version = static_versions(str(static))['style.css']
+    assert url == f'http://testserver/static_files/style.css?v={version}'
+
+    app = FastAPI()
+    app.mount('/static_files', PrecompressedStaticFiles(directory=str(static)), name='static')
+    client = TestClient(app)
+    assert client.get(url).headers['cache-control'] == IMMUTABLE_CACHE_CONTROL
+    # Без хэша или с устаревшим хэшем файл отдаётся с обычной перепроверкой
+    assert 'cache-control' not in client.get('/static_files/style.css').headers
+    assert 'cache-control' not in client.get('/static_files/style.css?v=000000000000').headers
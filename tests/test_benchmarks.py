@@ -0,0 +1,27 @@
+from benchmarks.http_routes import compare, percentile
+
+BASELINE = {'index': {'rps': 100.0, 'p95_ms': 10.0}}
+
+
+def metrics(rps: float, p95_ms: float, errors: int = 0) -> dict:
+    return {'requests': 100, 'errors': errors, 'rps': rps, 'p50_ms': 1.0, 'p95_ms': p95_ms, 'p99_ms': 20.0}
+
+
+def test_percentile():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile([7.0], 99) == 7
+
+
+def test_compare_within_tolerance():
+    assert compare({'index': metrics(85, 11.5)}, BASELINE, tolerance=0.2) == []
+    # Маршрута нет в эталоне - сравнивать не с чем
+    assert compare({'users': metrics(1, 1000)}, BASELINE, tolerance=0.2) == []
+
+
+def test_compare_reports_regressions():
+    regressions = compare({'index': metrics(70, 13, errors=2)}, BASELINE, tolerance=0.2)
+    assert len(regressions) == 3
+    assert all(regression.startswith('index:') for regression in regressions)
@@ -0,0 +1,63 @@
+import pytest
+from sqlmodel import SQLModel, Session, create_engine, select
+
+from app.bulk_import import import_users, read_records
+from app.main import User, pwd_context
+
+
+@pytest.fixture(name="engine")
+def engine_fixture(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'import.db'}")
+    SQLModel.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_import_csv(tmp_path, engine):
+    path = tmp_path / 'users.csv'
+    path.write_text(
+        'username,password,usermail,sympathy\n'
+        'barsik,qwe123,barsik@example.com,Marsik\n'
+        'marsik,qwe456,,\n'
+        'no_password,,,\n'
+        'barsik,other,,\n',
+        encoding='utf-8',
+    )
+    report = import_users(read_records(str(path)), engine, batch_size=2, workers=2)
+    assert report.read == 4
+    assert report.imported == 2
+    assert [error.line for error in report.errors] == [4, 5]
+    with Session(engine) as session:
+        users = {user.username: user for user in session.exec(select(User))}
+    assert users['marsik'].usermail is None
+    assert pwd_context.verify('qwe123', users['barsik'].hashed_password)
+
+
+def test_import_ndjson_skips_existing_users(tmp_path, engine):
+    with Session(engine) as session:
+        session.add(User(username='barsik', hashed_password='x'))
+        session.commit()
+    path = tmp_path / 'users.ndjson'
+    path.write_text('{"username": "barsik", "password": "1"}\n{"username": "marsik", "password": "2"}\n')
+    report = import_users(read_records(str(path)), engine, workers=1)
+    assert report.imported == 1
+    assert report.errors[0].error == 'username already exists'
+
+
+def test_import_ndjson_reports_unreadable_lines(tmp_path, engine):
+    path = tmp_path / 'users.ndjson'
+    path.write_text(
+        '{"username": "barsik", "password": "1"}\n'
+        '{"username": "broken", \n'
+        '["marsik", "2"]\n'
+        '42\n'
+        '{"username": "marsik", "password": "2"}\n'
+    )
+    report = import_users(read_records(str(path)), engine, batch_size=2, workers=1)
+    # Неразборчивая строка и значения JSON, не являющиеся объектом, не прерывают импорт
+    assert report.read == 5
+    assert report.imported == 2
+    assert [(error.line, error.username) for error in report.errors] == [(2, None), (3, None), (4, None)]
+    assert report.errors[0].error.startswith('invalid JSON')
+    with Session(engine) as session:
+        assert set(session.exec(select(User.username))) == {'barsik', 'marsik'}
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+import redis.asyncio as redis
+
+from app.routers.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.routers.page_cache import PageCache
+from app.routers.page_content import ContentUnavailable, PageContentRepository
+
+
+class FlakyRedis(redis.Redis):
+    """ Клиент Redis, который по флагу перестаёт отвечать: конвейер зависает дольше бюджета """
+    down = False
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = super().pipeline(transaction, shard_hint)
+        if FlakyRedis.down:
+            async def execute(raise_on_error=True):
+                await asyncio.sleep(10)
+            pipe.execute = execute
+        return pipe
+
+
+@pytest.mark.anyio
+async def test_breaker_opens_and_closes_after_probe():
+    probe_ok = False
+
+    async def probe():
+        if not probe_ok:
+            raise ConnectionError('Redis недоступен')
+
+    async def failing():
+        raise ConnectionError('Redis недоступен')
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    breaker = CircuitBreaker('test', probe, failure_threshold=2, reset_timeout=0.05, errors=(ConnectionError,))
+    with pytest.raises(ConnectionError):
+        await breaker.call(failing)
+    # Превышение бюджета - тоже отказ
+    with pytest.raises(TimeoutError):
+        await breaker.call(slow, budget=0.01)
+    assert breaker.is_open
+    with pytest.raises(CircuitOpenError):
+        await breaker.call(failing)
+
+    await asyncio.sleep(0.06)
+    with pytest.raises(CircuitOpenError):
+        await breaker.call(failing)
+    await asyncio.sleep(0)
+    # Неудачная проба оставляет выключатель разомкнутым
+    assert breaker.is_open
+
+    probe_ok = True
+    await asyncio.sleep(0.06)
+    with pytest.raises(CircuitOpenError):
+        await breaker.call(failing)
+    await asyncio.sleep(0)
+    assert not breaker.is_open
+
+
+@pytest.mark.anyio
+async def test_stale_content_served_when_redis_is_slow(redis_options: dict):
+    client = FlakyRedis(**redis_options)
+
+    async def probe():
+        if FlakyRedis.down:
+            raise redis.ConnectionError('Redis недоступен')
+
+    breaker = CircuitBreaker('test', probe, failure_threshold=1, reset_timeout=60, errors=(redis.RedisError,))
+    repository = PageContentRepository(client, PageCache(ttl=0), breaker=breaker, budget=0.5)
+    FlakyRedis.down = False
+    try:
+        fresh = await repository.get('log_out')
+        FlakyRedis.down = True
+        # Первый запрос ждёт бюджет и размыкает выключатель, второй получает копию сразу
+        stale = await repository.get('log_out')
+        assert breaker.is_open
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        again = await repository.get('log_out')
+        elapsed = loop.time() - started
+        with pytest.raises(ContentUnavailable):
+            await repository.get('barsik')
+    finally:
+        FlakyRedis.down = False
+        await client.aclose()
+    assert stale is fresh
+    assert again is fresh
+    assert elapsed < 0.05
@@ -0,0 +1,78 @@
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.responses import HTMLResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from app.main import app
+from app.routers.compression import CompressionMiddleware, choose_encoding
+from app.routers.pages import rendered_pages
+
+PAGE = '<!doctype html>' + '<p>Барсик и Марсик</p>' * 200
+
+
+def compressed_app() -> Starlette:
+    async def page(request):
+        return HTMLResponse(PAGE)
+
+    async def small(request):
+        return HTMLResponse('<p>ok</p>')
+
+    async def image(request):
+        return Response(b'\x89PNG' * 1000, media_type='image/png')
+
+    async def stream(request):
+        async def chunks():
+            for _ in range(3):
+                yield PAGE
+
+        return StreamingResponse(chunks(), media_type='text/html')
+
+    routes = [Route('/page', page), Route('/small', small), Route('/image', image), Route('/stream', stream)]
+    return Starlette(routes=routes, middleware=[(CompressionMiddleware, (), {'min_size': 1024})])
+
+
+def test_choose_encoding():
+    assert choose_encoding('gzip, deflate, br') == 'br'
+    assert choose_encoding('gzip, br;q=0') == 'gzip'
+    assert choose_encoding('identity') is None
+    assert choose_encoding('') is None
+
+
+def test_dynamic_response_compressed():
+    client = TestClient(compressed_app())
+    for encoding in ('br', 'gzip'):
+        response = client.get('/page', headers={'Accept-Encoding': encoding})
+        assert response.headers['content-encoding'] == encoding
+        assert response.headers['vary'] == 'Accept-Encoding'
+        assert int(response.headers['content-length']) < len(PAGE.encode()) // 5
+        assert response.text == PAGE
+    assert 'content-encoding' not in client.get('/page', headers={'Accept-Encoding': 'identity'}).headers
+
+
+def test_small_and_binary_responses_not_compressed():
+    client = TestClient(compressed_app())
+    assert 'content-encoding' not in client.get('/small', headers={'Accept-Encoding': 'gzip'}).headers
+    assert 'content-encoding' not in client.get('/image', headers={'Accept-Encoding': 'gzip'}).headers
+
+
+def test_streaming_response_compressed():
+    response = TestClient(compressed_app()).get('/stream', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['content-encoding'] == 'gzip'
+    assert response.text == PAGE * 3
+
+
+def test_cached_page_compressed_once():
+    rendered_pages.clear()
+    with TestClient(app) as client:
+        first = client.get('/', headers={'Accept-Encoding': 'br'})
+        (page,) = rendered_pages._pages.values()
+        encoded = page.encoded['br']
+        second = client.get('/', headers={'Accept-Encoding': 'br'})
+        plain = client.get('/', headers={'Accept-Encoding': 'identity'})
+        not_modified = client.get('/', headers={'Accept-Encoding': 'br', 'If-None-Match': first.headers['etag']})
+    assert first.headers['content-encoding'] == 'br'
+    assert page.encoded['br'] is encoded
+    assert second.content == plain.content == page.body
+    assert first.headers['etag'] != plain.headers['etag']
+    assert 'content-encoding' not in plain.headers
+    assert not_modified.status_code == 304
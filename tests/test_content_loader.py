@@ -0,0 +1,118 @@
+import asyncio
+import json
+
+import pytest
+import redis
+import redis.asyncio as async_redis
+
+from app.content_loader import CONTENT_VERSIONS_KEY, activate, main, prune, publish, validate
+from app.routers.page_cache import KEYSPACE_EVENTS, PageCache
+from app.routers.page_content import (CONTENT_KEY_PREFIX, CONTENT_VERSION_KEY, DOCUMENTS,
+                                      PageContentRepository)
+
+
+def make_content(title: str) -> dict:
+    content = {}
+    for document in DOCUMENTS.values():
+        for verified in (False, True):
+            for field in document(verified):
+                if field.command == 'lrange':
+                    content[field.key] = ['Главная', title]
+                elif field.command == 'hget':
+                    content.setdefault(field.key, {})[field.hash_field] = title
+                else:
+                    content[field.key] = title
+    return content
+
+
+@pytest.fixture(name='client')
+def client_fixture(sync_redis_client: redis.Redis):
+    def clean():
+        keys = [CONTENT_VERSION_KEY, CONTENT_VERSIONS_KEY, *sync_redis_client.scan_iter(match=CONTENT_KEY_PREFIX + '*')]
+        sync_redis_client.delete(*keys)
+
+    # Остальные тесты читают ключи без версии: указатель не должен пережить тест
+    clean()
+    yield sync_redis_client
+    clean()
+
+
+async def load_index(repository: PageContentRepository):
+    return await repository.load(DOCUMENTS['index'](False))
+
+
+def test_validate_reports_missing_and_mistyped_keys():
+    content = make_content('Барсик')
+    del content['log_out_message']
+    content['index_page_nav'] = 'Главная'
+    errors = validate(content)
+    assert 'log_out: нет ключа log_out_message' in errors
+    assert 'index: index_page_nav должен быть списком' in errors
+    assert validate(make_content('Барсик')) == []
+
+
+@pytest.mark.anyio
+async def test_publish_switches_version(client: redis.Redis, redis_client: async_redis.Redis):
+    first = publish(client, make_content('Барсик'))
+    assert client.get(CONTENT_VERSION_KEY) == first
+    assert client.hget(f'{CONTENT_KEY_PREFIX}{first}:index_page', 'title') == 'Барсик'
+    assert client.lrange(f'{CONTENT_KEY_PREFIX}{first}:index_page_nav', 0, -1) == ['Главная', 'Барсик']
+
+    repository = PageContentRepository(redis_client, PageCache(ttl=60))
+    assert (await load_index(repository))['title'] == 'Барсик'
+    second = publish(client, make_content('Марсик'))
+    assert second != first
+    # Репозиторий помнит старую версию, но видит новый указатель и перечитывает поля
+    assert (await load_index(repository))['title'] == 'Марсик'
+    assert repository.version == second
+
+    activate(client, first)
+    assert (await load_index(repository))['title'] == 'Барсик'
+
+
+def test_same_content_keeps_version(client: redis.Redis):
+    assert publish(client, make_content('Барсик')) == publish(client, make_content('Барсик'))
+    assert client.lrange(CONTENT_VERSIONS_KEY, 0, -1) == [client.get(CONTENT_VERSION_KEY)]
+
+
+def test_old_versions_pruned(client: redis.Redis):
+    versions = [publish(client, make_content(title), keep=1) for title in ('Барсик', 'Марсик', 'Бонус')]
+    assert client.lrange(CONTENT_VERSIONS_KEY, 0, -1) == versions[::-1][:2]
+    assert not list(client.scan_iter(match=f'{CONTENT_KEY_PREFIX}{versions[0]}:*'))
+    assert prune(client, keep=0) == [versions[1]]
+
+
+def test_cli_rejects_invalid_file(client: redis.Redis, tmp_path):
+    path = tmp_path / 'content.json'
+    path.write_text(json.dumps({'log_out_message': 'Пока'}), encoding='utf-8')
+    assert main([str(path)]) == 1
+    assert client.get(CONTENT_VERSION_KEY) is None
+
+
+def test_cli_publishes_yaml(client: redis.Redis, tmp_path):
+    path = tmp_path / 'content.yaml'
+    path.write_text(json.dumps(make_content('Барсик'), ensure_ascii=False), encoding='utf-8')
+    assert main([str(path)]) == 0
+    assert client.get(CONTENT_VERSION_KEY) is not None
+    assert main(['--activate', 'unknown']) == 1
+
+
+@pytest.mark.anyio
+async def test_versioned_key_edit_refreshes_page(client: redis.Redis, redis_client: async_redis.Redis):
+    version = publish(client, make_content('Барсик'))
+    # Тестовый сервер не знает CONFIG GET, поэтому слушатель не может сам включить keyspace-уведомления
+    client.config_set('notify-keyspace-events', KEYSPACE_EVENTS)
+    repository = PageContentRepository(redis_client, PageCache(ttl=60))
+    listener = repository.listen()
+    # После ошибки CONFIG GET тестовый сервер рвёт соединение, слушатель переподключается через секунду
+    while not repository.cache.subscribed:
+        await asyncio.sleep(0.01)
+    assert (await repository.get('index'))['title'] == 'Барсик'
+    # Правка через redis-cli: ключ текущей версии, а не ключ без префикса
+    client.hset(f'{CONTENT_KEY_PREFIX}{version}:index_page', 'title', 'Марсик')
+    for _ in range(100):
+        if (await repository.get('index'))['title'] == 'Марсик':
+            break
+        await asyncio.sleep(0.01)
+    listener.cancel()
+    assert (await repository.get('index'))['title'] == 'Марсик'
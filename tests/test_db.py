@@ -1,9 +1,13 @@
+import json
 import pytest
 from fastapi.testclient import TestClient
 from sqlmodel import SQLModel, create_engine, Session, StaticPool
 from app.main import app, get_db_session, UserCreate, User, pwd_context, UserUpdate
 from fastapi.encoders import jsonable_encoder
 
+# Тесты отправляют формы входа и регистрации: окна ограничителя частоты сбрасываются перед каждым тестом
+pytestmark = pytest.mark.usefixtures('reset_rate_limits')
+
 
 @pytest.fixture(name="session")
 def session_fixture():
@@ -22,8 +26,9 @@ def client_fixture(session: Session):
     def get_session_override():
         return session
     app.dependency_overrides[get_db_session] = get_session_override
-    client = TestClient(app)
-    yield client
+    # Клиент в контекстном менеджере: запросы идут в одном цикле событий, пул Redis закрывается в lifespan
+    with TestClient(app) as client:
+        yield client
     app.dependency_overrides.clear()
 
 
@@ -96,3 +101,40 @@ def test_delete_hero(session: Session, client: TestClient, create_user: User):
     assert response.status_code == 200
     assert data['ok'] == True
     assert user_in_db is None
+
+
+def test_create_user_duplicate_username(client: TestClient):
+    client.post("/reg/", data={"username": "Deadpond", "password": "qwerty123"})
+    response = client.post("/reg/", data={"username": "Deadpond", "password": "other"})
+    assert response.status_code == 409
+    assert len(client.get('/users/').json()) == 1
+
+
+def test_read_users_keyset_pagination(session: Session, client: TestClient):
+    for name in ('first', 'second', 'third'):
+        session.add(User(username=name, hashed_password='x'))
+    session.commit()
+    first_page = client.get('/users/', params={"limit": 2})
+    assert [user['username'] for user in first_page.json()] == ['first', 'second']
+    cursor = first_page.headers['X-Next-Cursor']
+    assert 'rel="next"' in first_page.headers['Link']
+    second_page = client.get('/users/', params={"limit": 2, "cursor": cursor})
+    assert [user['username'] for user in second_page.json()] == ['third']
+    assert 'X-Next-Cursor' not in second_page.headers
+
+
+def test_read_users_invalid_cursor(client: TestClient):
+    response = client.get('/users/', params={"cursor": "garbage"})
+    assert response.status_code == 400
+
+
+def test_export_users_ndjson(session: Session, client: TestClient, create_user: User):
+    session.add(create_user)
+    session.add(User(username='second', hashed_password='x'))
+    session.commit()
+    response = client.get('/users/export')
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    assert [line['username'] for line in lines] == ['Deadpond', 'second']
+    assert 'hashed_password' not in lines[0]
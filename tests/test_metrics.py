@@ -0,0 +1,56 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.routers.hashing import password_hasher, pwd_context
+from app.routers.metrics import Counter, Histogram, REGISTRY, password_hash_duration
+
+
+def test_histogram_render():
+    histogram = Histogram('test_duration_seconds', 'Тест', ('route',), buckets=(0.1, 1.0))
+    REGISTRY.remove(histogram)
+    histogram.observe(0.05, '/')
+    histogram.observe(0.1, '/')
+    histogram.observe(5, '/')
+    assert histogram.render()[2:] == [
+        'test_duration_seconds_bucket{route="/",le="0.1"} 2',
+        'test_duration_seconds_bucket{route="/",le="1.0"} 2',
+        'test_duration_seconds_bucket{route="/",le="+Inf"} 3',
+        'test_duration_seconds_sum{route="/"} 5.15',
+        'test_duration_seconds_count{route="/"} 3',
+    ]
+
+
+def test_counter_escapes_labels():
+    counter = Counter('test_total', 'Тест', ('path',))
+    REGISTRY.remove(counter)
+    counter.inc('a"b\\c')
+    counter.inc('a"b\\c', amount=2)
+    assert counter.render()[2:] == ['test_total{path="a\\"b\\\\c"} 3']
+
+
+def test_metrics_endpoint():
+    with TestClient(app) as client:
+        client.get('/oauth')
+        client.get('/users/1234567')
+        response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    text = response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/oauth"}' in text
+    # Метка route - шаблон пути, а не сам путь
+    assert 'route="/users/{user_id}"' in text and '1234567' not in text
+    assert 'http_requests_in_progress{method="GET"} 1' in text
+    assert 'redis_commands_total{command="PING"}' in text
+    assert 'sql_statements_total{engine="sync"' in text
+
+
+def test_password_hash_metrics():
+    before = password_hash_duration.count('verify')
+    hashed = pwd_context.hash('qwe123')
+    try:
+        assert asyncio.run(password_hasher.verify('qwe123', hashed))
+    finally:
+        password_hasher.shutdown()
+    assert password_hash_duration.count('verify') == before + 1
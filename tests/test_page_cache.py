@@ -0,0 +1,114 @@
+import asyncio
+
+from app.routers.page_cache import PageCache
+
+
+def loader_of(value, calls=None, delay=0.0):
+    """ Возвращает корутинную функцию загрузки, считающую свои вызовы """
+    async def loader():
+        if calls is not None:
+            calls.append(1)
+        await asyncio.sleep(delay)
+        return value
+    return loader
+
+
+def test_cache_hit_skips_loader():
+    async def scenario():
+        cache = PageCache(ttl=60)
+        calls = []
+        await cache.get(('index', False), loader_of({"title": "a"}, calls))
+        value = await cache.get(('index', False), loader_of({"title": "b"}, calls))
+        return value, calls
+
+    value, calls = asyncio.run(scenario())
+    assert value == {"title": "a"}
+    assert len(calls) == 1
+
+
+def test_cache_entry_expires():
+    async def scenario():
+        cache = PageCache(ttl=0.01)
+        await cache.get(('index', False), loader_of({"title": "a"}))
+        await asyncio.sleep(0.02)
+        return await cache.get(('index', False), loader_of({"title": "b"}))
+
+    assert asyncio.run(scenario()) == {"title": "b"}
+
+
+def test_concurrent_misses_load_once():
+    async def scenario():
+        cache = PageCache(ttl=60)
+        calls = []
+        loader = loader_of({"title": "a"}, calls, delay=0.05)
+        values = await asyncio.gather(*[cache.get(('index', False), loader) for _ in range(10)])
+        return values, calls
+
+    values, calls = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(value == {"title": "a"} for value in values)
+
+
+def test_keyspace_message_invalidates_dependent_entries():
+    async def scenario():
+        cache = PageCache(ttl=60)
+        await cache.get(('index', False), loader_of({"title": "a"}),
+                        depends_on=frozenset({'index_page', 'index_page_nav'}))
+        await cache.get(('barsik', True), loader_of({"title": "b"}), depends_on=frozenset({'barsik_page'}))
+        cache.handle_message({'type': 'pmessage', 'channel': '__keyspace@0__:index_page_nav', 'data': 'rpush'})
+        return (await cache.get(('index', False), loader_of({"title": "new"})),
+                await cache.get(('barsik', True), loader_of({"title": "new"})))
+
+    index, barsik = asyncio.run(scenario())
+    assert index == {"title": "new"}
+    assert barsik == {"title": "b"}
+
+
+def test_invalidation_message_clears_all():
+    async def scenario():
+        cache = PageCache(ttl=60)
+        await cache.get(('index', False), loader_of({"title": "a"}))
+        cache.handle_message({'type': 'message', 'channel': 'page_content:invalidate', 'data': '*'})
+        return await cache.get(('index', False), loader_of({"title": "new"}))
+
+    assert asyncio.run(scenario()) == {"title": "new"}
+
+
+def test_refill_started_before_invalidation_is_not_stored():
+    async def scenario():
+        cache = PageCache(ttl=60)
+        refill = asyncio.create_task(cache.get(('index', False), loader_of({"title": "old"}, delay=0.05)))
+        await asyncio.sleep(0.01)
+        cache.invalidate('index')
+        await refill
+        return await cache.get(('index', False), loader_of({"title": "new"}))
+
+    assert asyncio.run(scenario()) == {"title": "new"}
+
+
+def test_unrelated_key_keeps_refill():
+    async def scenario():
+        cache = PageCache(ttl=60)
+        depends_on = frozenset({'index_page'})
+        await cache.get(('index', False), loader_of({"title": "a"}), depends_on=depends_on)
+        cache.invalidate('index')
+        refill = asyncio.create_task(
+            cache.get(('index', False), loader_of({"title": "b"}, delay=0.05), depends_on=depends_on))
+        await asyncio.sleep(0.01)
+        # Ключ ограничителя частоты - не зависимость страницы: загрузка сохраняется в кэш
+        cache.handle_message(
+            {'type': 'message', 'channel': '__keyspace@0__:rate_limit:password:ip:1', 'data': 'pexpire'})
+        await refill
+        calls = []
+        value = await cache.get(('index', False), loader_of({"title": "c"}, calls))
+        # Изменение зависимости во время загрузки отбрасывает её результат
+        refill = asyncio.create_task(cache.get(('barsik', False), loader_of({"title": "d"}, delay=0.05)))
+        await asyncio.sleep(0.01)
+        cache.handle_message({'type': 'message', 'channel': '__keyspace@0__:barsik_page', 'data': 'hset'})
+        await refill
+        return value, calls, await cache.get(('barsik', False), loader_of({"title": "e"}))
+
+    value, calls, barsik = asyncio.run(scenario())
+    assert value == {"title": "b"}
+    assert calls == []
+    assert barsik == {"title": "e"}
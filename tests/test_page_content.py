@@ -0,0 +1,41 @@
+import pytest
+import redis.asyncio as redis
+
+from app.routers.page_cache import PageCache
+from app.routers.page_content import PageContentRepository, DOCUMENTS
+
+
+class CountingRedis(redis.Redis):
+    """ Клиент Redis, считающий сетевые обращения (запуски конвейера и одиночные команды) """
+    round_trips = 0
+
+    async def execute_command(self, *args, **options):
+        CountingRedis.round_trips += 1
+        return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        CountingRedis.round_trips += 1
+        return super().pipeline(transaction, shard_hint)
+
+
+@pytest.mark.anyio
+async def test_page_loaded_in_one_round_trip(redis_options: dict):
+    client = CountingRedis(**redis_options)
+    repository = PageContentRepository(client, PageCache(ttl=60))
+    CountingRedis.round_trips = 0
+    content = await repository.get('barsik', verified=True)
+    await client.aclose()
+    assert CountingRedis.round_trips == 1
+    assert set(content) == {'title', 'header', 'nav', 'header2', 'p1', 'p2', 'about'}
+
+
+def test_verified_variant_uses_verif_nav():
+    keys = {field.key for field in DOCUMENTS['marsik'](True)}
+    assert 'marsik_page_nav_verif' in keys
+    assert 'marsik_page_nav' not in keys
+
+
+def test_bonus_page_has_single_nav():
+    fields = {field.name: field.key for field in DOCUMENTS['bonus'](True)}
+    assert fields['nav'] == 'bonus_page_nav'
+    assert 'p3' in fields
@@ -1,31 +1,49 @@
 import httpx
 import pytest
 from fastapi.testclient import TestClient
-from app.main import app, verify_token, TokenData, UserCreate, pwd_context, User, UserBase, get_safety_session, \
+from app.main import app, verify_token, TokenData, UserCreate, pwd_context, User, UserBase, get_safety_session, get_async_session, \
     UserUpdate
-from sqlmodel import create_engine, StaticPool, SQLModel, Session
+from sqlmodel import create_engine, SQLModel, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import create_async_engine
+
+# Тесты отправляют формы входа и регистрации: окна ограничителя частоты сбрасываются перед каждым тестом
+pytestmark = pytest.mark.usefixtures('reset_rate_limits')
+
+
+@pytest.fixture(name="db_url")
+def db_url_fixture(tmp_path):
+    # Файл, а не память: синхронная и асинхронная сессии должны видеть одну и ту же базу
+    return f"sqlite:///{tmp_path / 'test.db'}"
 
 
 @pytest.fixture(name="session")
-def session_fixture():
-    engine = create_engine(
-        "sqlite:///",
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool
-    )
+def session_fixture(db_url: str):
+    engine = create_engine(db_url, connect_args={"check_same_thread": False})
     SQLModel.metadata.create_all(engine)
     with Session(engine) as session:
         yield session
+    engine.dispose()
 
 
 @pytest.fixture(name="client")
-def client_fixture(session: Session):
+def client_fixture(session: Session, db_url: str):
     def get_session_override():
         return session
 
+    async_engine = create_async_engine(db_url.replace("sqlite://", "sqlite+aiosqlite://"))
+
+    async def get_async_session_override():
+        async with AsyncSession(async_engine, expire_on_commit=False) as async_session:
+            yield async_session
+
     app.dependency_overrides[get_safety_session] = get_session_override
-    client = TestClient(app)
-    yield client
+    app.dependency_overrides[get_async_session] = get_async_session_override
+    # Клиент в контекстном менеджере: запросы идут в одном цикле событий, пул Redis закрывается в lifespan
+    with TestClient(app) as client:
+        yield client
     app.dependency_overrides.clear()
 
 
@@ -82,6 +100,7 @@ def test_get_oauth_page(client: TestClient):
     response = client.get("/oauth")
     assert response.status_code == 200
     assert '<!doctype html>' in response.text
+    assert 'oauth.css?v=' in response.text
 
 
 def test_get_reg_page(client: TestClient):
@@ -158,3 +177,47 @@ def test_update_user_non_existing(
     )
     assert response.status_code == 404
     assert '<!doctype html>' in response.text
+
+
+def test_get_index_etag(client: TestClient):
+    response = client.get("/")
+    etag = response.headers['ETag']
+    cached = client.get("/", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers['ETag'] == etag
+    assert cached.content == b''
+
+
+def test_get_oauth_page_stale_etag(client: TestClient):
+    response = client.get("/oauth", headers={"If-None-Match": '"stale"'})
+    assert response.status_code == 200
+    assert '<!doctype html>' in response.text
+    assert response.headers['ETag']
+
+
+def test_authenticated_index_not_cached(client: TestClient):
+    client.cookies.set('access-token', 'fake_cookie')
+    response = client.get("/")
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
+
+
+def test_settings_page_loads_user_once(session: Session, create_user: User, client: TestClient):
+    session.add(create_user)
+    session.commit()
+    token = client.post("/token", data={"username": "Deadpond", "password": "qwe123"}).json()['access_token']
+    statements = []
+
+    def count_user_selects(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('SELECT') and 'FROM user' in statement:
+            statements.append(statement)
+
+    event.listen(Engine, 'before_cursor_execute', count_user_selects)
+    try:
+        # Первый запрос проверяет токен по БД, второй берёт его из кэша - в обоих случаях пользователь читается один раз
+        for expected in (1, 2):
+            response = client.get('/settings', headers={"Authorization": f"Bearer {token}"})
+            assert response.status_code == 200
+            assert len(statements) == expected
+    finally:
+        event.remove(Engine, 'before_cursor_execute', count_user_selects)
@@ -0,0 +1,51 @@
+import json
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routers.profiling import ProfilingMiddleware, route_directory
+
+
+def make_client(tmp_path, **options) -> TestClient:
+    app = FastAPI()
+
+    @app.get('/items/{item_id}')
+    async def get_item(item_id: int):
+        started = time.perf_counter()
+        while time.perf_counter() - started < 0.01:
+            pass
+        return {'id': item_id}
+
+    app.add_middleware(ProfilingMiddleware, directory=str(tmp_path), **options)
+    return TestClient(app)
+
+
+def profiles(tmp_path) -> list:
+    return sorted(tmp_path.glob('items_item_id/*.speedscope.json'))
+
+
+def test_route_directory():
+    assert route_directory('/users/{user_id}') == 'users_user_id'
+    assert route_directory('/') == 'root'
+
+
+def test_profile_by_header(tmp_path):
+    client = make_client(tmp_path, header_token='secret')
+    client.get('/items/1')
+    client.get('/items/1', headers={'X-Profile': 'wrong'})
+    assert profiles(tmp_path) == []
+
+    assert client.get('/items/1', headers={'X-Profile': 'secret'}).json() == {'id': 1}
+    [path] = profiles(tmp_path)
+    assert '-GET-200-' in path.name
+    profile = json.loads(path.read_text(encoding='utf-8'))
+    assert profile['$schema'] == 'https://www.speedscope.app/file-format-schema.json'
+    assert any(frame['name'] == 'get_item' for frame in profile['shared']['frames'])
+
+
+def test_sampling_and_rotation(tmp_path):
+    client = make_client(tmp_path, sample_rate=1.0, max_files=2)
+    for item_id in range(3):
+        client.get(f'/items/{item_id}')
+    assert len(profiles(tmp_path)) == 2
@@ -0,0 +1,57 @@
+import asyncio
+import uuid
+
+import pytest
+import redis.asyncio as redis
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.routers.metrics import rate_limit_decisions
+from app.routers.rate_limit import RateLimiter
+
+pytestmark = pytest.mark.usefixtures('reset_rate_limits')
+
+
+@pytest.mark.anyio
+async def test_sliding_window_limits_each_key(redis_client: redis.Redis):
+    limiter = RateLimiter(redis_client, name=f'test-{uuid.uuid4().hex}', window=60, per_ip=3, per_username=2)
+    results = [
+        await limiter.hit('10.0.0.1', 'alice'),
+        await limiter.hit('10.0.0.1', 'alice'),
+        # Логин исчерпал лимит, а IP - нет
+        await limiter.hit('10.0.0.1', 'alice'),
+        await limiter.hit('10.0.0.1', 'bob'),
+        # Теперь исчерпан лимит IP
+        await limiter.hit('10.0.0.1', 'carol'),
+        await limiter.hit('10.0.0.2', 'carol'),
+    ]
+    assert results[:2] == [0, 0]
+    assert 0 < results[2] <= 60
+    assert results[3] == 0
+    assert 0 < results[4] <= 60
+    assert results[5] == 0
+
+
+@pytest.mark.anyio
+async def test_window_slides(redis_client: redis.Redis):
+    limiter = RateLimiter(redis_client, name=f'test-{uuid.uuid4().hex}', window=0.2, per_ip=1, per_username=0)
+    first, second = await limiter.hit('10.0.0.1', None), await limiter.hit('10.0.0.1', None)
+    await asyncio.sleep(0.25)
+    third = await limiter.hit('10.0.0.1', None)
+    assert first == 0
+    assert second > 0
+    assert third == 0
+
+
+def test_token_rate_limited_before_hashing():
+    limited = rate_limit_decisions.get('password', 'limited')
+    with TestClient(app) as client:
+        statuses = [
+            client.post('/token', data={'username': 'rate_limited_user', 'password': 'wrong'}).status_code
+            for _ in range(10)
+        ]
+        response = client.post('/token', data={'username': 'rate_limited_user', 'password': 'wrong'})
+    assert 429 not in statuses
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+    assert rate_limit_decisions.get('password', 'limited') - limited == 1
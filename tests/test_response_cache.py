@@ -0,0 +1,16 @@
+from app.routers.response_cache import etag_matches, make_etag
+
+
+def test_etag_is_strong_and_stable():
+    etag = make_etag(b'<!doctype html>')
+    assert etag == make_etag(b'<!doctype html>')
+    assert etag.startswith('"') and not etag.startswith('W/')
+
+
+def test_etag_matches():
+    etag = make_etag(b'body')
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches('*', etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches('"other"', etag)
@@ -0,0 +1,95 @@
+import asyncio
+import time
+import uuid
+
+import pytest
+import redis.asyncio as redis
+
+from app.routers.revocation import BloomFilter, TokenRevocationList
+from app.routers.token_cache import TokenCache
+
+
+def revocation_list(client: redis.Redis, **options) -> TokenRevocationList:
+    return TokenRevocationList(client, capacity=1000, error_rate=0.01, rebuild_interval=600, **options)
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    added = [uuid.uuid4().hex for _ in range(1000)]
+    for item in added:
+        bloom.add(item)
+    assert all(item in bloom for item in added)
+    false_positives = sum(uuid.uuid4().hex in bloom for _ in range(10000))
+    assert false_positives < 300
+
+
+@pytest.mark.anyio
+async def test_revoked_token_found(redis_client: redis.Redis):
+    revoked = []
+    revocations = revocation_list(redis_client, on_revoke=revoked.append)
+    jti = uuid.uuid4().hex
+    await revocations.revoke(jti, time.time() + 60)
+    assert await revocations.is_revoked(jti)
+    assert not await revocations.is_revoked(uuid.uuid4().hex)
+    assert revoked == [jti]
+
+
+@pytest.mark.anyio
+async def test_revocation_propagated_to_other_process(redis_client: redis.Redis):
+    received = []
+    sender, receiver = revocation_list(redis_client), revocation_list(redis_client, on_revoke=received.append)
+    listener = receiver.listen()
+    while not receiver.synced:
+        await asyncio.sleep(0.01)
+    jti = uuid.uuid4().hex
+    await sender.revoke(jti, time.time() + 60)
+    for _ in range(200):
+        if received:
+            break
+        await asyncio.sleep(0.01)
+    listener.cancel()
+    assert received == [jti]
+
+
+@pytest.mark.anyio
+async def test_synced_check_skips_redis(redis_client: redis.Redis):
+    revocations = revocation_list(redis_client)
+    await revocations.sync()
+
+    async def exists(*keys):
+        raise AssertionError('запрос к Redis для неотозванного токена')
+
+    redis_client.exists = exists
+    assert await revocations.is_revoked(uuid.uuid4().hex) is False
+
+
+@pytest.mark.anyio
+async def test_token_revoked_while_disconnected_evicted_from_cache(redis_client: redis.Redis, monkeypatch):
+    cache = TokenCache(max_entries=10, ttl=60)
+    jti = uuid.uuid4().hex
+    cache.put('token', 'Deadpond', time.time() + 60, jti)
+    sender, receiver = revocation_list(redis_client), revocation_list(redis_client, on_revoke=cache.invalidate_jti)
+    outage = False
+    get_message = redis.client.PubSub.get_message
+
+    async def flaky_get_message(self, *args, **kwargs):
+        if outage:
+            raise redis.ConnectionError('соединение разорвано')
+        return await get_message(self, *args, **kwargs)
+
+    monkeypatch.setattr(redis.client.PubSub, 'get_message', flaky_get_message)
+    listener = receiver.listen()
+    while not receiver.synced:
+        await asyncio.sleep(0.01)
+    outage = True
+    while receiver.synced:
+        await asyncio.sleep(0.01)
+    # Сообщение об отзыве слушатель пропускает: подписка в это время потеряна
+    await sender.revoke(jti, time.time() + 60)
+    outage = False
+    for _ in range(300):
+        if receiver.synced and cache.get('token') is None:
+            break
+        await asyncio.sleep(0.01)
+    listener.cancel()
+    assert cache.get('token') is None
@@ -1,32 +1,51 @@
 import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import create_engine, StaticPool, SQLModel, Session
+from sqlmodel import create_engine, SQLModel, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
 from app.main import app, OAuth2PasswordRequestForm, authenticate_user, UserCreate, pwd_context, User, \
-    get_safety_session, verify_token, TokenData
+    get_safety_session, get_async_session, verify_token, TokenData
 from typing import Annotated
 from fastapi import Form
+from app.main import get_db_session
+from app.routers.token_cache import token_cache
+from app.routers.hashing import password_hasher
+
+# Тесты отправляют формы входа и регистрации: окна ограничителя частоты сбрасываются перед каждым тестом
+pytestmark = pytest.mark.usefixtures('reset_rate_limits')
+
+
+@pytest.fixture(name="db_url")
+def db_url_fixture(tmp_path):
+    # Файл, а не память: синхронная и асинхронная сессии должны видеть одну и ту же базу
+    return f"sqlite:///{tmp_path / 'test.db'}"
 
 
 @pytest.fixture(name="session")
-def session_fixture():
-    engine = create_engine(
-        "sqlite:///",
-        connect_args={"check_same_thread": False},
-        poolclass=StaticPool
-    )
+def session_fixture(db_url: str):
+    engine = create_engine(db_url, connect_args={"check_same_thread": False})
     SQLModel.metadata.create_all(engine)
     with Session(engine) as session:
         yield session
+    engine.dispose()
 
 
 @pytest.fixture(name="client")
-def client_fixture(session: Session):
+def client_fixture(session: Session, db_url: str):
     def get_session_override():
         return session
 
+    async_engine = create_async_engine(db_url.replace("sqlite://", "sqlite+aiosqlite://"))
+
+    async def get_async_session_override():
+        async with AsyncSession(async_engine, expire_on_commit=False) as async_session:
+            yield async_session
+
     app.dependency_overrides[get_safety_session] = get_session_override
-    client = TestClient(app)
-    yield client
+    app.dependency_overrides[get_async_session] = get_async_session_override
+    # Клиент в контекстном менеджере: запросы идут в одном цикле событий, пул Redis закрывается в lifespan
+    with TestClient(app) as client:
+        yield client
     app.dependency_overrides.clear()
 
 
@@ -89,3 +108,51 @@ def test_validate_login_form_user_not_found(session: Session, client: TestClient
     assert response.status_code == 404
     assert '<!doctype html>' in response.text
     assert response.headers['WWW-Authenticate'] == "Bearer"
+
+
+def test_verified_token_dropped_after_user_deleted(session: Session, client: TestClient, create_user: User):
+    app.dependency_overrides[get_db_session] = lambda: session
+    session.add(create_user)
+    session.commit()
+    token = client.post("/token", data={"username": "fake_user", "password": "fake_password"}).json()['access_token']
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get('/suc_oauth', headers=headers).status_code == 200
+    assert token_cache.get(token) == 'fake_user'
+    client.delete(f"/users/{create_user.id}")
+    assert token_cache.get(token) is None
+    assert client.get('/suc_oauth', headers=headers).status_code == 404
+
+
+def test_login_rejected_when_hashing_queue_full(session: Session, client: TestClient, create_user: User):
+    session.add(create_user)
+    session.commit()
+    max_pending = password_hasher.max_pending
+    password_hasher.max_pending = 0
+    try:
+        response = client.post("/token", data={"username": "fake_user", "password": "fake_password"})
+    finally:
+        password_hasher.max_pending = max_pending
+    assert response.status_code == 503
+    assert response.headers['Retry-After']
+
+
+def test_password_hashing_status(session: Session, client: TestClient, create_user: User):
+    session.add(create_user)
+    session.commit()
+    client.post("/token", data={"username": "fake_user", "password": "fake_password"})
+    data = client.get("/status/password_hashing").json()
+    assert data['pending'] == 0
+    assert data['completed'] >= 1
+    assert data['avg_latency_ms'] > 0
+
+
+def test_token_revoked_after_log_out(session: Session, client: TestClient, create_user: User):
+    session.add(create_user)
+    session.commit()
+    token = client.post("/token", data={"username": "fake_user", "password": "fake_password"}).json()['access_token']
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get('/suc_oauth', headers=headers).status_code == 200
+    assert client.get('/log_out', headers=headers).status_code == 200
+    assert token_cache.get(token) is None
+    response = client.get('/suc_oauth', headers=headers)
+    assert response.status_code == 401
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.routers.page_content import DOCUMENTS, page_content
+from app.routers.sql_db import get_engine
+from app.server import worker_count, worker_environment
+from app.warmup import warm_async_db
+
+
+def test_worker_count(monkeypatch):
+    monkeypatch.setattr('os.cpu_count', lambda: 8)
+    assert worker_count(3) == 3
+    assert worker_count(0) == 8
+
+
+def test_worker_environment(monkeypatch):
+    monkeypatch.setattr('os.cpu_count', lambda: 8)
+    monkeypatch.setattr('app.server.settings.password_hash_workers', 0)
+    # Рабочие процессы не создают схему, а ядра для bcrypt делятся между ними
+    assert worker_environment(4) == {'CREATE_SCHEMA_ON_STARTUP': 'false', 'PASSWORD_HASH_WORKERS': '2'}
+    monkeypatch.setattr('app.server.settings.password_hash_workers', 3)
+    assert worker_environment(4) == {'CREATE_SCHEMA_ON_STARTUP': 'false'}
+
+
+def test_startup_warms_pools_and_page_content():
+    page_content.cache.invalidate()
+    with TestClient(app):
+        cached = set(page_content.cache._entries)
+        # Соединения пула БД открыты до первого запроса
+        assert get_engine().pool.checkedin() > 0
+    assert {(document, verified) for document in DOCUMENTS for verified in (False, True)} <= cached
+
+
+@pytest.mark.anyio
+async def test_async_db_warmup_survives_failed_connect(monkeypatch):
+    closed = []
+
+    class Connection:
+        async def execute(self, statement):
+            pass
+
+        async def close(self):
+            closed.append(self)
+
+    class Engine:
+        calls = 0
+
+        async def connect(self):
+            Engine.calls += 1
+            if Engine.calls == 2:
+                raise ConnectionError('БД недоступна')
+            await asyncio.sleep(0.01)
+            return Connection()
+
+    monkeypatch.setattr('app.warmup.get_async_engine', Engine)
+    # Ошибка одного соединения не подвешивает прогрев, а открытые соединения возвращаются в пул
+    with pytest.raises(ConnectionError):
+        await asyncio.wait_for(warm_async_db(3), timeout=1)
+    assert len(closed) == 2
@@ -0,0 +1,34 @@
+from sqlalchemy import text
+
+from app.routers.sql_db import build_engine, create_missing_indexes
+
+
+def test_sqlite_file_uses_wal_and_pragmas(tmp_path):
+    engine = build_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == 'wal'
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() > 0
+    engine.dispose()
+
+
+def test_sqlite_memory_engine():
+    engine = build_engine("sqlite://")
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT 1")).scalar() == 1
+
+
+def test_missing_indexes_added_to_existing_table(tmp_path):
+    from app.routers.db import User  # noqa: F401 - регистрирует модель в метаданных
+    engine = build_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE user (id INTEGER PRIMARY KEY, username VARCHAR NOT NULL, usermail VARCHAR, "
+            "personal_username VARCHAR, sex VARCHAR, birthdate DATE, sympathy VARCHAR, hashed_password VARCHAR)"
+        ))
+    create_missing_indexes(engine)
+    with engine.connect() as connection:
+        indexes = {row[1]: row[2] for row in connection.execute(text("PRAGMA index_list('user')"))}
+    assert indexes['ix_user_username'] == 1
+    assert indexes['ix_user_usermail'] == 1
+    engine.dispose()
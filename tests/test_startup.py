@@ -0,0 +1,54 @@
+import json
+import os
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.startup import by_package, parse_importtime, startup_report
+
+# Допустимое время холодного импорта app.main, сек: импорт не открывает соединений и не строит движки БД
+COLD_START_BUDGET = 3.0
+
+COLD_START_SCRIPT = '''
+import json, sys, time
+started = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - started
+from app.routers import sql_db
+print(json.dumps({
+    'seconds': elapsed,
+    'uvicorn': 'uvicorn' in sys.modules,
+    'engines': [sql_db._engine is not None, sql_db._async_engine is not None],
+}))
+'''
+
+
+def test_cold_import_within_budget():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, '-c', COLD_START_SCRIPT], capture_output=True, text=True,
+                            check=True, cwd=root)
+    report = json.loads(result.stdout)
+    assert report['seconds'] < COLD_START_BUDGET
+    assert not report['uvicorn']
+    assert report['engines'] == [False, False]
+
+
+def test_parse_importtime():
+    rows = parse_importtime(
+        'import time: self [us] | cumulative | imported package\n'
+        'import time:       120 |        120 |     redis.exceptions\n'
+        'import time:       300 |        420 |   redis\n'
+        'import time:        50 |        470 | app.main\n'
+    )
+    assert [(row.module, row.depth) for row in rows] == [('redis.exceptions', 2), ('redis', 1), ('app.main', 0)]
+    assert by_package(rows) == {'redis': 420, 'app.main': 50}
+
+
+def test_startup_report_lists_init_steps():
+    with TestClient(app):
+        steps = [name for name, _ in startup_report.steps]
+    assert 'import app.main' in steps
+    assert {'pages: precompile', 'warmup: warm_up'} <= set(steps)
+    assert 'warmup: warm_up' in startup_report.render()
@@ -0,0 +1,23 @@
+from app.routers.templating import PRECOMPILED_TEMPLATES, build_environment, precompile, templates
+
+
+def test_bytecode_cache_skips_compilation(tmp_path, monkeypatch):
+    warm = build_environment(cache_dir=str(tmp_path))
+    warm.get_template('index.html')
+    assert list(tmp_path.iterdir())
+
+    # Новый процесс с тем же каталогом байткода берёт шаблон с диска, не компилируя его
+    cold = build_environment(cache_dir=str(tmp_path))
+
+    def compile_forbidden(*args, **kwargs):
+        raise AssertionError('template was compiled again')
+
+    monkeypatch.setattr(cold, 'compile', compile_forbidden)
+    assert cold.get_template('index.html').name == 'index.html'
+
+
+def test_precompile_loads_templates():
+    precompile()
+    cached = {name for _, name in templates.env.cache.keys()}
+    assert set(PRECOMPILED_TEMPLATES) <= cached
+    assert {'static_url', 'picture', 'url_for'} <= templates.env.globals.keys()
@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+import pytest
+import redis.asyncio as redis
+
+from app.routers.token_cache import TokenCache, TokenCacheSync
+
+
+def test_cached_token_returns_username():
+    cache = TokenCache(max_entries=10, ttl=60)
+    cache.put('token', 'Deadpond', time.time() + 60)
+    assert cache.get('token') == 'Deadpond'
+    assert cache.get('other_token') is None
+
+
+def test_token_evicted_after_exp():
+    cache = TokenCache(max_entries=10, ttl=60)
+    cache.put('token', 'Deadpond', time.time() - 1)
+    assert cache.get('token') is None
+
+
+def test_cache_is_bounded():
+    cache = TokenCache(max_entries=2, ttl=60)
+    for token in ('a', 'b', 'c'):
+        cache.put(token, 'Deadpond', time.time() + 60)
+    assert cache.get('a') is None
+    assert cache.get('c') == 'Deadpond'
+
+
+def test_invalidate_user():
+    cache = TokenCache(max_entries=10, ttl=60)
+    cache.put('a', 'Deadpond', time.time() + 60)
+    cache.put('b', 'Deadpond', time.time() + 60)
+    cache.put('c', 'Dive', time.time() + 60)
+    cache.invalidate_user('Deadpond')
+    assert cache.get('a') is None
+    assert cache.get('b') is None
+    assert cache.get('c') == 'Dive'
+
+
+def test_invalidate_jti():
+    cache = TokenCache(max_entries=10, ttl=60)
+    cache.put('a', 'Deadpond', time.time() + 60, 'jti-a')
+    cache.put('b', 'Deadpond', time.time() + 60, 'jti-b')
+    cache.invalidate_jti('jti-a')
+    assert cache.get('a') is None
+    assert cache.get('b') == 'Deadpond'
+
+
+@pytest.mark.anyio
+async def test_invalidation_reaches_other_process(redis_client: redis.Redis):
+    # Два кэша - как в двух рабочих процессах
+    sender, receiver = TokenCacheSync(TokenCache(10, 60), redis_client), TokenCacheSync(TokenCache(10, 60), redis_client)
+    listener = receiver.listen()
+    while not receiver.subscribed:
+        await asyncio.sleep(0.01)
+    for sync in (sender, receiver):
+        sync.cache.put('token', 'Deadpond', time.time() + 60)
+    await sender.invalidate_user('Deadpond')
+    for _ in range(200):
+        if receiver.cache.get('token') is None:
+            break
+        await asyncio.sleep(0.01)
+    listener.cancel()
+    assert sender.cache.get('token') is None
+    assert receiver.cache.get('token') is None